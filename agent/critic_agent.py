@@ -1,16 +1,23 @@
-from agent.prompts import CRITIC_PROMPT
-from agent.llm_client import generate_response
+from agent.prompts import CRITIC_PROMPT, CRITIC_VERDICT_PROMPT
+from agent.verdict_cache import review
+from agent.verdicts import parse_verdict, format_notes
 
 def critic_agent(state):
-    prompt = CRITIC_PROMPT.format(draft=state.draft)
-    result = generate_response(prompt)
+    # One-token verdict first, detailed notes only on failure; identical
+    # drafts (e.g. re-checks after an edit) reuse cached verdicts
+    result = review("critic", CRITIC_PROMPT, state.draft, CRITIC_VERDICT_PROMPT, "GOOD")
+
+    # Tolerant parse: JSON verdict, or free text starting with GOOD
+    verdict = parse_verdict(result, "GOOD")
 
     updates = {
-        "metadata": {**state.metadata, "critic_pass": result.strip() == "GOOD"}
+        # Only our own key: safety runs in parallel and writes safety_pass
+        "metadata": {"critic_pass": verdict["passed"]}
     }
     
-    if result.strip() != "GOOD":
-        updates["critic_notes"] = state.critic_notes + [result]
+    if not verdict["passed"]:
+        # Append-only channel: return just the new (compact) note
+        updates["critic_notes"] = [format_notes(verdict)]
 
     return updates
 
@@ -1,5 +1,11 @@
 from agent.prompts import DRAFTER_PROMPT, DRAFTER_PROMPT_WITH_CONTEXT
-from agent.llm_client import generate_response
+from agent.llm_client import generate_response, get_node_config
+from agent.stream_utils import emit_event
+from agent import semantic_cache
+from agent import pipelined_safety
+
+# Each note is truncated in the context prompt so its length stays bounded
+NOTE_CONTEXT_CHARS = 500
 
 def drafter_agent(state):
     """
@@ -18,7 +24,7 @@ def drafter_agent(state):
         
         # Add information about rejected drafts
         if has_rejected_drafts and has_previous_drafts:
-            num_rejected = len(state.previous_drafts)
+            num_rejected = state.metadata.get("rejections", len(state.previous_drafts))
             context_parts.append(f"The user has REJECTED {num_rejected} previous draft(s).")
             context_parts.append("They want a DIFFERENT approach, not just minor edits.")
             
@@ -31,12 +37,12 @@ def drafter_agent(state):
         if state.safety_notes:
             context_parts.append("\nPrevious Safety Concerns:")
             for note in state.safety_notes[-3:]:  # Last 3 safety notes
-                context_parts.append(f"  - {note}")
+                context_parts.append(f"  - {note[:NOTE_CONTEXT_CHARS]}")
         
         if state.critic_notes:
             context_parts.append("\nPrevious Quality Feedback:")
             for note in state.critic_notes[-3:]:  # Last 3 critic notes
-                context_parts.append(f"  - {note}")
+                context_parts.append(f"  - {note[:NOTE_CONTEXT_CHARS]}")
         
         # Use context-aware prompt
         context = "\n".join(context_parts)
@@ -48,8 +54,23 @@ def drafter_agent(state):
         # First attempt - use standard prompt
         prompt = DRAFTER_PROMPT.format(user_query=state.user_query)
     
-    # Generate the draft
-    new_draft = generate_response(prompt, stream_output=True)
+    # First attempt: reuse a previously approved exercise for a similar query
+    # (opt-in). It still goes through safety and critic like any other draft.
+    cache_hit = None
+    aborted = None
+    if is_first_attempt(state):
+        cache_hit = semantic_cache.lookup(state.user_query)
+    
+    if cache_hit:
+        new_draft = cache_hit["content"]
+        cache_hit = {"query": cache_hit["query"], "score": round(cache_hit["score"], 4)}
+        emit_event({"type": "cache_hit", **cache_hit})
+    elif pipelined_safety.PIPELINED_SAFETY:
+        # Screen sections as they stream; a hard failure stops the draft early
+        new_draft, aborted = pipelined_safety.generate_screened(prompt, **get_node_config("drafter"))
+    else:
+        # Generate the draft
+        new_draft = generate_response(prompt, stream_output=True, **get_node_config("drafter"))
 
     # Build the updates dictionary
     updates = {
@@ -57,13 +78,25 @@ def drafter_agent(state):
         "metadata": {
             **state.metadata, 
             "iterations": state.metadata.get("iterations", 0) + 1,
-            "user_rejected": False  # Reset rejection flag after processing
+            "user_rejected": False,  # Reset rejection flag after processing
+            "semantic_cache_hit": cache_hit,
+            "draft_aborted": aborted is not None
         }
     }
+
+    if aborted is not None:
+        # Routed straight to the supervisor (see drafter_condition) as a failed draft
+        emit_event({"type": "draft_aborted", "reason": aborted.note})
+        updates["metadata"].update({"safety_pass": False, "critic_pass": False, "safety_screen": aborted.categories})
+        updates["safety_notes"] = [aborted.note]
     
-    # Add old draft to previous drafts if it exists
+    # Add old draft to previous drafts if it exists (append-only channel)
     if state.draft:
-        updates["previous_drafts"] = state.previous_drafts + [state.draft]
+        updates["previous_drafts"] = [state.draft]
     
     return updates
 
+
+def is_first_attempt(state):
+    """True when nothing has been drafted, rejected or reviewed yet."""
+    return not (state.draft or state.previous_drafts or state.safety_notes or state.critic_notes)
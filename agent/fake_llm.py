@@ -0,0 +1,101 @@
+"""
+Deterministic offline LLM backend (LLM_BACKEND=fake).
+
+Stands in for the OpenAI API in benchmarks and local runs: no network,
+no cost, configurable latency and token rate. Outputs are seeded from
+the prompt, so the same prompt always gets the same answer (and the
+verdict cache behaves as it would in production).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+# - FAKE_LLM_LATENCY: seconds before the first token
+# - FAKE_LLM_TOKENS_PER_SEC: streaming rate after the first token
+# - FAKE_LLM_DRAFT_TOKENS: length of generated drafts
+# - FAKE_LLM_SAFE_RATE / FAKE_LLM_GOOD_RATE: share of reviews that pass
+# - FAKE_LLM_SEED: change to get a different (still deterministic) run
+# - FAKE_EMBEDDING_DIM: size of fake embedding vectors
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "200"))
+FAKE_LLM_DRAFT_TOKENS = int(os.getenv("FAKE_LLM_DRAFT_TOKENS", "300"))
+FAKE_LLM_SAFE_RATE = float(os.getenv("FAKE_LLM_SAFE_RATE", "0.9"))
+FAKE_LLM_GOOD_RATE = float(os.getenv("FAKE_LLM_GOOD_RATE", "0.8"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED", "cerina")
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "64"))
+
+_WORDS = (
+    "notice the thought write it down rate how strongly you believe it "
+    "look for evidence for and against consider a balanced alternative "
+    "breathe slowly for four counts practice this step each day "
+    "reflect on what changed and be kind to yourself"
+).split()
+
+
+def _rng(text):
+    digest = hashlib.sha256(f"{FAKE_LLM_SEED}\x1f{text}".encode("utf-8")).digest()
+    return random.Random(digest)
+
+
+def _review(passed, verdict, issues, json_output):
+    if json_output:
+        return json.dumps({
+            "verdict": verdict,
+            "severity": "none" if passed else "medium",
+            "issues": [] if passed else [{"issue": issue, "fix": fix} for issue, fix in issues],
+        })
+    return verdict if passed else "\n".join(f"- {issue}" for issue, _ in issues)
+
+
+def _reply(prompt, json_output=False):
+    rng = _rng(prompt)
+    if "Safety Inspector" in prompt:
+        passed = rng.random() < FAKE_LLM_SAFE_RATE
+        return _review(passed, "SAFE" if passed else "UNSAFE",
+                       [("Step 3 asks for prolonged exposure", "add a grounding step first")], json_output)
+    if "Quality Reviewer" in prompt:
+        passed = rng.random() < FAKE_LLM_GOOD_RATE
+        return _review(passed, "GOOD" if passed else "REVISE",
+                       [("Purpose of each step is unclear", "explain why each step helps"),
+                        ("No closing reflection", "add a short reflection at the end")], json_output)
+    words = [rng.choice(_WORDS) for _ in range(FAKE_LLM_DRAFT_TOKENS)]
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return "\n".join(f"{n}. {line.capitalize()}." for n, line in enumerate(lines, 1))
+
+
+async def agenerate(prompt, temperature=0.2, callback=None, max_tokens=None, stop=None, json_output=False):
+    """
+    Fake completion; streams word-sized tokens to `callback` if given.
+    max_tokens counts words; stop truncates like the real API.
+    """
+    await asyncio.sleep(FAKE_LLM_LATENCY)
+    reply = _reply(prompt, json_output)
+    for sequence in stop or ():
+        reply = reply.split(sequence, 1)[0]
+    if max_tokens:
+        reply = " ".join(reply.split(" ")[:max_tokens])
+    if callback is None:
+        tokens = len(reply.split())
+        if FAKE_LLM_TOKENS_PER_SEC > 0:
+            await asyncio.sleep(tokens / FAKE_LLM_TOKENS_PER_SEC)
+        return reply
+
+    delay = 1 / FAKE_LLM_TOKENS_PER_SEC if FAKE_LLM_TOKENS_PER_SEC > 0 else 0
+    for i, token in enumerate(reply.split(" ")):
+        if delay:
+            await asyncio.sleep(delay)
+        callback(token if i == 0 else " " + token)
+    return reply
+
+
+async def aembed(texts):
+    """Fake embeddings: a fixed pseudo-random unit-scale vector per text."""
+    await asyncio.sleep(FAKE_LLM_LATENCY / 4)
+    vectors = []
+    for text in texts:
+        rng = _rng(text)
+        vectors.append([rng.uniform(-1.0, 1.0) for _ in range(FAKE_EMBEDDING_DIM)])
+    return vectors
@@ -1,40 +1,225 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
+import asyncio
+import httpx
 import os
+import queue
+import threading
+import time
+import weakref
 load_dotenv()
 
-client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-
 from agent.stream_utils import get_stream_callback
+from agent import fake_llm
+import metrics
 
-def generate_response(prompt: str, temperature: float = 0.2, stream_output: bool = False) -> str:
-    callback = get_stream_callback() if stream_output else None
-    
-    if callback:
-        stream = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=temperature,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            stream=True
+# LLM_BACKEND: "openai" (default) or "fake" (agent/fake_llm.py: offline,
+# deterministic; used by benchmark.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+
+MODEL = "fake" if LLM_BACKEND == "fake" else "gpt-4o-mini"
+EMBEDDING_MODEL = "fake" if LLM_BACKEND == "fake" else "text-embedding-3-small"
+
+# Per-node completion settings. Override any of them with
+# LLM_<NODE>_MODEL / LLM_<NODE>_TEMPERATURE / LLM_<NODE>_MAX_TOKENS /
+# LLM_<NODE>_STOP ("|"-separated), e.g. LLM_SAFETY_MODEL=gpt-4.1-nano.
+# "verdict" is the one-token fast-path review (see verdict_cache.review).
+# json_output requests a JSON object (reviewers; parsed by agent/verdicts.py).
+NODE_DEFAULTS = {
+    "drafter": {"model": MODEL, "temperature": 0.2, "max_tokens": None, "stop": None, "json_output": False},
+    "safety": {"model": MODEL, "temperature": 0.2, "max_tokens": 600, "stop": None, "json_output": True},
+    "critic": {"model": MODEL, "temperature": 0.2, "max_tokens": 600, "stop": None, "json_output": True},
+    "verdict": {"model": MODEL, "temperature": 0.0, "max_tokens": 1, "stop": None, "json_output": False},
+}
+
+# Concurrency / connection pool tuning
+# - LLM_MAX_IN_FLIGHT: max concurrent completions per event loop
+# - LLM_MAX_CONNECTIONS: max open HTTP connections to the API
+# - LLM_MAX_KEEPALIVE: idle keep-alive connections kept warm for reuse
+# - LLM_KEEPALIVE_EXPIRY: seconds an idle keep-alive connection is kept
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+# httpx connections and asyncio primitives are bound to the loop that
+# created them, so keep one client + semaphore per running event loop.
+_loop_resources = weakref.WeakKeyDictionary()
+
+# Background loop used by the sync shim (generate_response)
+_background_loop = None
+_background_lock = threading.Lock()
+
+_DONE = object()
+
+
+def _get_loop_resources():
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            )
         )
-        full_response = []
-        for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content:
-                full_response.append(content)
-                callback(content)
-        return "".join(full_response)
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+        resources = (client, asyncio.Semaphore(LLM_MAX_IN_FLIGHT))
+        _loop_resources[loop] = resources
+    return resources
+
+
+def get_node_config(node):
+    """Completion kwargs (model, temperature, max_tokens, stop, json_output) for a graph node."""
+    config = dict(NODE_DEFAULTS.get(node, NODE_DEFAULTS["drafter"]))
+    prefix = f"LLM_{node.upper()}_"
+    if os.getenv(prefix + "MODEL") and LLM_BACKEND != "fake":
+        config["model"] = os.getenv(prefix + "MODEL")
+    if os.getenv(prefix + "TEMPERATURE"):
+        config["temperature"] = float(os.getenv(prefix + "TEMPERATURE"))
+    if os.getenv(prefix + "MAX_TOKENS"):
+        config["max_tokens"] = int(os.getenv(prefix + "MAX_TOKENS")) or None
+    if os.getenv(prefix + "STOP"):
+        config["stop"] = os.getenv(prefix + "STOP").split("|")
+    return config
+
+
+def _get_background_loop():
+    global _background_loop
+    if _background_loop is None:
+        with _background_lock:
+            if _background_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+                _background_loop = loop
+    return _background_loop
+
+
+async def agenerate_response(prompt: str, temperature: float = 0.2, stream_output: bool = False, callback=None,
+                             model: str = None, max_tokens: int = None, stop=None, json_output: bool = False) -> str:
+    """
+    Async completion. At most LLM_MAX_IN_FLIGHT requests run concurrently
+    per event loop; the rest wait on the semaphore instead of opening more
+    connections. If stream_output is set, tokens are passed to `callback`
+    (or the context's stream callback) as they arrive.
+    model/max_tokens/stop default to MODEL and the API defaults; json_output
+    asks for a JSON object reply. See
+    get_node_config. Latency, token counts and cost are recorded in metrics.py.
+    """
+    if stream_output and callback is None:
+        callback = get_stream_callback()
+
+    model = model or MODEL
+    params = {"model": model, "temperature": temperature, "messages": [{"role": "user", "content": prompt}]}
+    if max_tokens:
+        params["max_tokens"] = max_tokens
+    if stop:
+        params["stop"] = stop
+    if json_output:
+        params["response_format"] = {"type": "json_object"}
+
+    start = time.perf_counter()
+    first_token = []
+
+    def on_token(token):
+        if not first_token:
+            first_token.append(time.perf_counter() - start)
+        callback(token)
+
+    usage = None
+    if LLM_BACKEND == "fake":
+        text = await fake_llm.agenerate(prompt, temperature, on_token if callback else None, max_tokens, stop, json_output)
     else:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=temperature,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        client, semaphore = _get_loop_resources()
+        async with semaphore:
+            # Time the request itself, not the wait for a slot
+            start = time.perf_counter()
+            if callback:
+                stream = await client.chat.completions.create(
+                    **params,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                full_response = []
+                try:
+                    async for chunk in stream:
+                        # With include_usage the last chunk has usage and no choices
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        content = chunk.choices[0].delta.content
+                        if content:
+                            full_response.append(content)
+                            on_token(content)
+                finally:
+                    # Release the connection even if the caller cancelled us mid-stream
+                    await stream.close()
+                text = "".join(full_response)
+            else:
+                response = await client.chat.completions.create(**params)
+                usage = response.usage
+                text = response.choices[0].message.content
+
+    _record_usage(model, prompt, text, usage, time.perf_counter() - start, first_token[0] if first_token else None)
+    return text
+
+
+def _record_usage(model, prompt, text, usage, duration, ttft):
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        # No usage reported (fake backend): ~4 characters per token
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(text or "") // 4
+    metrics.observe_llm(model, duration, prompt_tokens, completion_tokens, ttft)
+
+
+def generate_response(prompt: str, temperature: float = 0.2, stream_output: bool = False, **params) -> str:
+    """
+    Sync shim over agenerate_response for the (sync) agents; `params` are
+    model/max_tokens/stop/json_output (e.g. **get_node_config("safety")).
+    The request runs on a shared background event loop; streamed tokens are
+    handed back to this thread so the stream callback runs where it was set.
+    """
+    callback = get_stream_callback() if stream_output else None
+    loop = _get_background_loop()
+
+    if callback is None:
+        future = asyncio.run_coroutine_threadsafe(agenerate_response(prompt, temperature, **params), loop)
+        return future.result()
+
+    tokens = queue.SimpleQueue()
+    future = asyncio.run_coroutine_threadsafe(
+        agenerate_response(prompt, temperature, stream_output=True, callback=tokens.put, **params), loop
+    )
+    future.add_done_callback(lambda _: tokens.put(_DONE))
+    try:
+        while True:
+            token = tokens.get()
+            if token is _DONE:
+                break
+            callback(token)
+    except BaseException:
+        # Callback failed (e.g. client went away): stop the upstream stream too
+        future.cancel()
+        raise
+    return future.result()
+
+async def aembed_texts(texts):
+    """Embed a batch of texts; returns one vector (list of floats) per text."""
+    if LLM_BACKEND == "fake":
+        return await fake_llm.aembed(texts)
+    client, semaphore = _get_loop_resources()
+    async with semaphore:
+        response = await client.embeddings.create(model=EMBEDDING_MODEL, input=list(texts))
+    return [item.embedding for item in response.data]
+
+
+def embed_texts(texts):
+    """Sync shim over aembed_texts."""
+    future = asyncio.run_coroutine_threadsafe(aembed_texts(texts), _get_background_loop())
+    return future.result()
 
 if __name__=="__main__":
     result = generate_response("Hello,!")
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.llm_client import generate_response, get_node_config
+from agent.prompts import SAFETY_VERDICT_PROMPT
+from agent.safety_screen import screen, format_hits
+from agent.stream_utils import get_stream_callback, set_stream_callback, stream_callback_var
+from agent.verdict_cache import cached_review
+from agent.verdicts import parse_verdict
+
+# Pipelined safety screening while the drafter streams (opt-in)
+# - PIPELINED_SAFETY: screen each finished section of the draft as it streams
+#   and abort the drafter on a hard failure
+# - PIPELINED_SAFETY_LLM: also send each section to the one-token LLM verdict
+# - PIPELINED_SAFETY_MIN_CHARS: shorter sections are merged into the next one
+# - PIPELINED_SAFETY_WORKERS: concurrent LLM section checks (process-wide)
+PIPELINED_SAFETY = os.getenv("PIPELINED_SAFETY", "false").lower() == "true"
+PIPELINED_SAFETY_LLM = os.getenv("PIPELINED_SAFETY_LLM", "false").lower() == "true"
+PIPELINED_SAFETY_MIN_CHARS = int(os.getenv("PIPELINED_SAFETY_MIN_CHARS", "200"))
+PIPELINED_SAFETY_WORKERS = int(os.getenv("PIPELINED_SAFETY_WORKERS", "4"))
+
+# A section ends at a blank line or before a numbered / "Step N" / heading line
+_SECTION_BREAK = re.compile(r"\n[ \t]*\n|\n(?=[ \t]*(?:\d+[.)]\s|step\s+\d+|#+\s))", re.IGNORECASE)
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINED_SAFETY_WORKERS, thread_name_prefix="cerina-section-check")
+
+
+class DraftAborted(Exception):
+    """Raised from the token callback when a finished section fails safety."""
+
+    def __init__(self, note, categories):
+        super().__init__(note)
+        self.note = note
+        self.categories = categories
+
+
+class SectionScreener:
+    """Cuts streamed text into sections and screens each one as it completes."""
+
+    def __init__(self, use_llm=PIPELINED_SAFETY_LLM):
+        self.use_llm = use_llm
+        self.text = ""        # everything streamed so far
+        self._pending = ""    # tail not yet part of a finished section
+        self._sections = 0
+        self._futures = []
+        self._failure = None
+        self._lock = threading.Lock()
+
+    def feed(self, token):
+        self.text += token
+        self._pending += token
+        while True:
+            match = _SECTION_BREAK.search(self._pending, PIPELINED_SAFETY_MIN_CHARS)
+            if match is None:
+                break
+            section, self._pending = self._pending[:match.end()], self._pending[match.end():]
+            self._check(section)
+        self._raise_if_failed()
+
+    def finish(self):
+        """Screen the last section and wait for outstanding LLM checks."""
+        if self._pending.strip():
+            self._check(self._pending)
+            self._pending = ""
+        for future in self._futures:
+            future.result()
+        self._raise_if_failed()
+
+    def cancel(self):
+        for future in self._futures:
+            future.cancel()
+
+    def _check(self, section):
+        self._sections += 1
+        number = self._sections
+        hard = [hit for hit in screen(section) if hit["severity"] == "hard"]
+        if hard:
+            self._fail(DraftAborted(
+                f"Local safety screen stopped the draft at section {number}:\n" + format_hits(hard),
+                sorted({hit["category"] for hit in hard})
+            ))
+        elif self.use_llm:
+            self._futures.append(_executor.submit(self._llm_check, number, section))
+
+    def _llm_check(self, number, section):
+        if self._failure is not None:
+            return
+        try:
+            verdict = cached_review(SAFETY_VERDICT_PROMPT, section, **get_node_config("verdict"))
+        except Exception as e:
+            # A failed check must not abort a draft; the full review still runs
+            print(f"Section safety check failed: {e}")
+            return
+        if not parse_verdict(verdict, "SAFE")["passed"]:
+            excerpt = " ".join(section.split())[:160]
+            self._fail(DraftAborted(
+                f"Safety review stopped the draft at section {number}:\n- Unsafe section: \"{excerpt}...\"",
+                ["llm_section_check"]
+            ))
+
+    def _fail(self, error):
+        with self._lock:
+            if self._failure is None:
+                self._failure = error
+
+    def _raise_if_failed(self):
+        if self._failure is not None:
+            raise self._failure
+
+
+def generate_screened(prompt, **params):
+    """
+    Stream a draft like generate_response(stream_output=True), screening
+    each section as it completes. Tokens still reach the context's stream
+    callback. Returns (draft, None), or (partial draft, DraftAborted) when
+    a section failed; the upstream completion is cancelled on abort.
+    """
+    screener = SectionScreener()
+    downstream = get_stream_callback()
+
+    def on_token(token):
+        if downstream:
+            downstream(token)
+        screener.feed(token)
+
+    reset_token = set_stream_callback(on_token)
+    try:
+        draft = generate_response(prompt, stream_output=True, **params)
+        screener.finish()
+        return draft, None
+    except DraftAborted as e:
+        screener.cancel()
+        return screener.text, e
+    finally:
+        stream_callback_var.reset(reset_token)
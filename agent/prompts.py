@@ -50,8 +50,43 @@ Check for:
 - medical recommendations
 - triggering instructions
 
-If everything is safe, respond only with: SAFE
-Otherwise list all safety issues clearly.
+Respond with JSON only, in this shape:
+{{"verdict": "SAFE" or "UNSAFE", "severity": "none", "low", "medium" or "high",
+  "issues": [{{"issue": "...", "fix": "..."}}]}}
+Keep each issue and fix under 20 words. Use an empty issues list when safe.
+"""
+
+# Appended to SAFETY_PROMPT when the local pre-screen (safety_screen.py)
+# found soft hits
+SAFETY_SCREEN_HINT = """
+A local screen flagged these passages; check them carefully:
+{hits}
+"""
+
+# One-token fast-path verdicts (verdict_cache.review): only a failing
+# verdict is followed by the detailed SAFETY_PROMPT / CRITIC_PROMPT review.
+SAFETY_VERDICT_PROMPT = """
+You are a CBT Safety Inspector.
+Analyze the following draft:
+
+{draft}
+
+Check for unsafe advice, extreme exposure steps, self-harm content,
+medical recommendations and triggering instructions.
+
+Answer with exactly one word: SAFE or UNSAFE
+"""
+
+CRITIC_VERDICT_PROMPT = """
+You are a CBT Clinical Quality Reviewer.
+Review the draft:
+
+{draft}
+
+Check empathy, clarity, CBT correctness, step difficulty progression,
+tone and professionalism.
+
+Answer with exactly one word: GOOD or REVISE
 """
 
 CRITIC_PROMPT = """
@@ -67,8 +102,10 @@ Check:
 - step difficulty progression
 - tone and professionalism
 
-If the draft is good, reply: GOOD
-Else, list improvement suggestions.
+Respond with JSON only, in this shape:
+{{"verdict": "GOOD" or "REVISE", "severity": "none", "low", "medium" or "high",
+  "issues": [{{"issue": "...", "fix": "..."}}]}}
+Keep each issue and fix under 20 words. Use an empty issues list when good.
 """
 
 REWRITE_PROMPT = """
@@ -1,16 +1,38 @@
-from agent.prompts import SAFETY_PROMPT
-from agent.llm_client import generate_response
+from agent.prompts import SAFETY_PROMPT, SAFETY_VERDICT_PROMPT, SAFETY_SCREEN_HINT
+from agent.verdict_cache import review
+from agent.safety_screen import screen, format_hits, SAFETY_SCREEN_HINTS
+from agent.verdicts import parse_verdict, format_notes
 
 def safety_agent(state):
-    prompt = SAFETY_PROMPT.format(draft=state.draft)
-    result = generate_response(prompt)
+    # Local pre-screen: a hard lexicon hit fails the draft without an LLM call
+    hits = screen(state.draft)
+    hard = [hit for hit in hits if hit["severity"] == "hard"]
+    if hard:
+        return {
+            "metadata": {"safety_pass": False, "safety_screen": sorted({hit["category"] for hit in hard})},
+            "safety_notes": ["Local safety screen found unsafe content:\n" + format_hits(hard)]
+        }
+
+    if hits and SAFETY_SCREEN_HINTS:
+        # Soft hits: skip the fast path and point the reviewer at the passages
+        hint = SAFETY_SCREEN_HINT.format(hits=format_hits(hits)).replace("{", "{{").replace("}", "}}")
+        result = review("safety", SAFETY_PROMPT + hint, state.draft)
+    else:
+        # One-token verdict first, detailed notes only on failure; identical
+        # drafts (e.g. re-checks after an edit) reuse cached verdicts
+        result = review("safety", SAFETY_PROMPT, state.draft, SAFETY_VERDICT_PROMPT, "SAFE")
+
+    # Tolerant parse: JSON verdict, or free text starting with SAFE
+    verdict = parse_verdict(result, "SAFE")
 
     updates = {
-        "metadata": {**state.metadata, "safety_pass": result.strip() == "SAFE"}
+        # Only our own key: critic runs in parallel and writes critic_pass
+        "metadata": {"safety_pass": verdict["passed"], "safety_screen": []}
     }
     
-    if result.strip() != "SAFE":
-        updates["safety_notes"] = state.safety_notes + [result]
+    if not verdict["passed"]:
+        # Append-only channel: return just the new (compact) note
+        updates["safety_notes"] = [format_notes(verdict)]
 
     return updates
 
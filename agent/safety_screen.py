@@ -0,0 +1,155 @@
+import json
+import os
+import re
+
+# Local safety pre-screen, run before the LLM safety review
+# - SAFETY_SCREEN_ENABLED: run the screen at all
+# - SAFETY_SCREEN_HINTS: pass soft-hit passages to the LLM reviewer
+# - SAFETY_LEXICON: path to a JSON lexicon replacing DEFAULT_LEXICON, shaped
+#   {"hard": {"category": ["regex", ...]}, "soft": {...}}
+# Hard hits fail the draft without an LLM call; soft hits are only hints.
+SAFETY_SCREEN_ENABLED = os.getenv("SAFETY_SCREEN_ENABLED", "true").lower() == "true"
+SAFETY_SCREEN_HINTS = os.getenv("SAFETY_SCREEN_HINTS", "true").lower() == "true"
+SAFETY_LEXICON = os.getenv("SAFETY_LEXICON", "")
+
+_EXCERPT_CHARS = 40
+
+# Hard hits are checked against the text before them in their sentence:
+# - negated instructions are skipped ("do not harm yourself", "don’t
+#   ever hurt yourself", "never suddenly stop taking...")
+# - conditional or referral wording demotes them to soft hits, for the LLM
+#   to judge ("if you might hurt yourself, call...", "talk to your doctor
+#   before you change your medication", "ask whether to reduce your dose")
+_NEGATED = re.compile(
+    r"(?:\bnot|\bnever|n['’]t)(?:\s+(?:ever|even|just|really|\w+ly)){0,2}\s+$", re.IGNORECASE
+)
+_REFERRAL = re.compile(
+    r"\b(?:if|whether|before|unless|in\s+case|doctor|prescriber|psychiatrist|pharmacist|gp|clinician"
+    r"|crisis\s+line|hotline|emergency\s+services)\b",
+    re.IGNORECASE
+)
+_SENTENCE_END = re.compile(r"[.!?\n]")
+
+# Standard safety wording no hard pattern may fail (checked when the
+# lexicon is compiled, including a custom SAFETY_LEXICON)
+KNOWN_SAFE = [
+    "If you ever feel like you might hurt yourself, call a crisis line.",
+    "Please don’t hurt yourself.",
+    "Please don't hurt yourself.",
+    "You should not ever hurt yourself.",
+    "Never stop taking your medication without medical advice.",
+    "Talk to your doctor before you change your medication.",
+    "Ask your prescriber whether to reduce your dose.",
+    "If you have thoughts of self-harm, call emergency services.",
+    "Drink 250 ml of water and take a short walk.",
+    "Give yourself a break and cut yourself some slack.",
+]
+
+# Patterns are case-insensitive regexes. Hard patterns target instructions,
+# not mentions: "if you have thoughts of self-harm, call..." must not match.
+DEFAULT_LEXICON = {
+    "hard": {
+        "self_harm_instruction": [
+            r"\b(?:cut|burn|hurt|harm|starve|punish|kill)\s+yourself\b(?!\s+(?:off|some\s+slack|a\s+break))",
+            r"\b(?:ways|methods?|how)\s+to\s+(?:end\s+your\s+life|commit\s+suicide|self[- ]harm)\b",
+        ],
+        "medication_dosing": [
+            r"\b(?:increase|double|reduce|lower|skip|change)\s+(?:your\s+|the\s+)?(?:dose|dosage|medication|meds)\b",
+            r"\bstop\s+taking\s+(?:your\s+|the\s+)?(?:medication|meds|pills|antidepressants?)\b",
+            # A quantity only counts as dosing next to medication words
+            # ("250 ml of water", "200 mg of caffeine" are soft hits at most)
+            r"\b(?:take|taking|dose|dosage|prescribed)\b[^.\n]{0,30}?\b\d+(?:\.\d+)?\s?(?:mg|mcg|milligrams?)\b",
+            r"\b\d+(?:\.\d+)?\s?(?:mg|mcg|milligrams?)\s+(?:of\s+)?(?:your\s+|the\s+)?(?:medication|meds|pills?|tablets?|capsules?|antidepressants?)\b",
+        ],
+        "unsafe_exposure": [
+            r"\b(?:without|no)\s+(?:any\s+)?(?:breaks?|stopping)\s+until\s+(?:the\s+)?panic\b",
+            r"\bforce\s+yourself\s+to\s+stay\b.{0,40}\b(?:no\s+matter|even\s+if)\b",
+        ],
+    },
+    "soft": {
+        "diagnosis": [
+            r"\bdiagnos(?:e|is|ed)\b",
+            r"\byou\s+(?:have|suffer\s+from)\s+(?:clinical\s+)?(?:depression|an?\s+anxiety\s+disorder|ptsd|ocd|bipolar)\b",
+        ],
+        "medical_advice": [
+            r"\b(?:prescri(?:be|ption)|medication|antidepressants?|supplements?)\b",
+            r"\b\d+(?:\.\d+)?\s?(?:mg|mcg|milligrams?)\b",
+        ],
+        "intense_exposure": [r"\bflooding\b", r"\b(?:worst|most\s+feared)\s+(?:fear|situation)\b"],
+        "restriction": [r"\b(?:fasting|skip\s+meals?)\b"],
+    },
+}
+
+_compiled = None  # (regex, [(severity, category)] by group index)
+
+
+def _load_lexicon():
+    if SAFETY_LEXICON:
+        with open(SAFETY_LEXICON, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_LEXICON
+
+
+def _compile():
+    """One combined regex, one named group per (severity, category)."""
+    global _compiled
+    if _compiled is None:
+        lexicon = _load_lexicon()
+        groups, labels = [], []
+        for severity in ("hard", "soft"):
+            for category, patterns in lexicon.get(severity, {}).items():
+                if patterns:
+                    groups.append(f"(?P<g{len(labels)}>{'|'.join(f'(?:{p})' for p in patterns)})")
+                    labels.append((severity, category))
+        _compiled = (re.compile("|".join(groups), re.IGNORECASE) if groups else None, labels)
+        for sentence in KNOWN_SAFE:
+            for hit in screen(sentence):
+                if hit["severity"] == "hard":
+                    print(f"⚠️ Safety lexicon fails safe wording [{hit['category']}]: {sentence}")
+    return _compiled
+
+
+def _sentence(text, start, end):
+    """Bounds of the sentence around text[start:end]."""
+    before = [m.end() for m in _SENTENCE_END.finditer(text, 0, start)]
+    after = _SENTENCE_END.search(text, end)
+    return (before[-1] if before else 0), (after.start() if after else len(text))
+
+
+def screen(text):
+    """
+    Return [{severity, category, match, start, excerpt}] for every lexicon
+    hit in `text`, in order of appearance.
+    """
+    if not SAFETY_SCREEN_ENABLED or not text:
+        return []
+    regex, labels = _compile()
+    if regex is None:
+        return []
+    hits = []
+    for match in regex.finditer(text):
+        severity, category = labels[int(match.lastgroup[1:])]
+        start, end = match.span()
+        if severity == "hard":
+            sentence_start, sentence_end = _sentence(text, start, end)
+            if _NEGATED.search(text, sentence_start, start):
+                continue
+            if _REFERRAL.search(text[sentence_start:sentence_end]):
+                severity = "soft"
+        excerpt = text[max(0, start - _EXCERPT_CHARS):end + _EXCERPT_CHARS].replace("\n", " ").strip()
+        hits.append({
+            "severity": severity,
+            "category": category,
+            "match": match.group(0),
+            "start": start,
+            "excerpt": excerpt,
+        })
+    return hits
+
+
+def format_hits(hits):
+    """Notes text for hits, one line per hit."""
+    return "\n".join(
+        f"- [{hit['category']}] \"{hit['match']}\" at char {hit['start']}: ...{hit['excerpt']}..."
+        for hit in hits
+    )
@@ -0,0 +1,133 @@
+import os
+import threading
+
+import numpy as np
+
+from agent.llm_client import embed_texts
+
+# Semantic cache of approved exercises (opt-in)
+# - SEMANTIC_CACHE_ENABLED: serve a previously approved exercise for similar queries
+# - SEMANTIC_CACHE_THRESHOLD: minimum cosine similarity for a hit
+# - SEMANTIC_CACHE_MAX_ROWS: most recent approved exercises loaded into the index
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ROWS = int(os.getenv("SEMANTIC_CACHE_MAX_ROWS", "5000"))
+
+_EMBED_BATCH = 100
+
+_lock = threading.Lock()
+_loaded = False
+_loading = False  # a thread is building the index (outside _lock)
+_pending = []     # (entry, vector) added while the index was being built
+_vectors = None   # (n, dim) float32, rows L2-normalized
+_entries = []     # [{"query": ..., "content": ...}] aligned with _vectors
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _build():
+    """
+    Build (entries, vectors) from the most recent approved, safety-passed
+    rows in saved_exercises (latest content per query). Runs without _lock.
+    """
+    from checkpoint_store import get_pool
+
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT query, content FROM (
+                    SELECT DISTINCT ON (query) query, content, created_at
+                    FROM saved_exercises
+                    WHERE safety_pass IS TRUE AND query <> '' AND content <> ''
+                    ORDER BY query, created_at DESC
+                ) latest
+                ORDER BY created_at DESC
+                LIMIT %s
+            """, (SEMANTIC_CACHE_MAX_ROWS,))
+            rows = cur.fetchall()
+
+    entries = [{"query": q, "content": c} for q, c in rows]
+    vectors = []
+    for i in range(0, len(entries), _EMBED_BATCH):
+        vectors.extend(embed_texts([e["query"] for e in entries[i:i + _EMBED_BATCH]]))
+    return entries, _normalize(vectors) if vectors else None
+
+
+def _ensure_loaded():
+    """
+    Load the index once. The first caller builds it and swaps it in;
+    callers arriving meanwhile get False (a cache miss) instead of waiting.
+    """
+    global _loaded, _loading, _pending, _vectors, _entries
+    with _lock:
+        if _loaded:
+            return True
+        if _loading:
+            return False
+        _loading = True
+    try:
+        entries, vectors = _build()
+    except Exception:
+        with _lock:
+            _loading = False
+        raise
+    with _lock:
+        for entry, vector in _pending:
+            entries.append(entry)
+            vectors = vector if vectors is None else np.vstack([vectors, vector])
+        _pending = []
+        _entries, _vectors = entries, vectors
+        _loaded, _loading = True, False
+    return True
+
+
+def lookup(user_query: str):
+    """
+    Return {"query", "content", "score"} for the most similar approved
+    exercise if its similarity clears SEMANTIC_CACHE_THRESHOLD, else None.
+    """
+    if not SEMANTIC_CACHE_ENABLED or not user_query.strip():
+        return None
+    try:
+        if not _ensure_loaded():
+            return None
+        with _lock:
+            if _vectors is None:
+                return None
+            vectors, entries = _vectors, _entries
+
+        query_vec = _normalize(embed_texts([user_query]))[0]
+        scores = vectors @ query_vec
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        return {**entries[best], "score": score}
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {e}")
+        return None
+
+
+def add(user_query: str, content: str):
+    """Add a newly approved exercise to the in-process index."""
+    global _vectors
+    if not SEMANTIC_CACHE_ENABLED or not user_query.strip() or not content:
+        return
+    try:
+        vector = _normalize(embed_texts([user_query]))
+        entry = {"query": user_query, "content": content}
+        with _lock:
+            if _loading:
+                _pending.append((entry, vector))  # merged when the build swaps in
+                return
+            if not _loaded:
+                return  # picked up from the table on first lookup
+            _entries.append(entry)
+            _vectors = vector if _vectors is None else np.vstack([_vectors, vector])
+    except Exception as e:
+        print(f"Semantic cache update failed: {e}")
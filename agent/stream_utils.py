@@ -11,3 +11,15 @@ def set_stream_callback(callback: Callable[[str], None]):
 
 def get_stream_callback() -> Optional[Callable[[str], None]]:
     return stream_callback_var.get()
+
+# ContextVar for structured (non-token) stream events, e.g. cache hits.
+# The callback should accept a dict with at least a 'type' key.
+event_callback_var: contextvars.ContextVar[Optional[Callable[[dict], None]]] = contextvars.ContextVar("event_callback", default=None)
+
+def set_event_callback(callback: Callable[[dict], None]):
+    return event_callback_var.set(callback)
+
+def emit_event(event: dict):
+    callback = event_callback_var.get()
+    if callback:
+        callback(event)
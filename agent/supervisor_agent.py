@@ -1,3 +1,17 @@
+import os
+
+from state import draft_hash
+
+# Max drafter passes per autonomous loop (reset by each user reject/edit).
+# When reached, the best-scoring draft so far goes to human approval.
+MAX_ITERATIONS = int(os.getenv("MAX_ITERATIONS", "5"))
+
+
+def draft_score(metadata):
+    """Rank drafts for the terminal fallback: safety outweighs quality."""
+    return 2 * bool(metadata.get("safety_pass", True)) + bool(metadata.get("critic_pass", True))
+
+
 def supervisor_agent(state):
     user_action = state.user_action
 
@@ -8,6 +22,7 @@ def supervisor_agent(state):
         return {
             "final_output": state.draft,
             "metadata": {**state.metadata, "next_node": "human_approval_done"},
+            "speculative": {},
             "user_action": ""
         }
         
@@ -19,7 +34,12 @@ def supervisor_agent(state):
     if user_action == "edit":
         return {
             "draft": state.edited_text,
-            "metadata": {**state.metadata, "edited_by_user": True, "next_node": "safety"},
+            "metadata": {
+                **state.metadata, "edited_by_user": True, "next_node": "review",
+                "loop_start": state.metadata.get("iterations", 0), "best_draft": None,
+                "max_iterations_reached": False
+            },
+            "speculative": {},
             "user_action": ""
         }
 
@@ -28,10 +48,37 @@ def supervisor_agent(state):
     # 3) USER CHOSE REJECT
     # ------------------------------------
     if user_action == "reject":
+        # A speculative alternative for this exact draft already passed
+        # safety and critic: serve it instead of drafting from scratch
+        speculative = state.speculative or {}
+        if speculative.get("draft") and speculative.get("base_hash") == draft_hash(state.draft):
+            return {
+                "metadata": {
+                    **state.metadata, "user_rejected": False, "next_node": "human_approval",
+                    "rejections": state.metadata.get("rejections", 0) + 1,
+                    "iterations": speculative.get("iterations", state.metadata.get("iterations", 0) + 1),
+                    "loop_start": state.metadata.get("iterations", 0), "best_draft": None,
+                    "max_iterations_reached": False,
+                    "safety_pass": True, "critic_pass": True,
+                    "speculative_served": True
+                },
+                "previous_drafts": [state.draft],  # append-only channel
+                "draft": speculative["draft"],
+                "speculative": {},
+                "user_action": ""
+            }
+
         return {
-            "metadata": {**state.metadata, "user_rejected": True, "next_node": "drafter"},
-            "previous_drafts": state.previous_drafts + [state.draft],
+            "metadata": {
+                **state.metadata, "user_rejected": True, "next_node": "drafter",
+                "rejections": state.metadata.get("rejections", 0) + 1,
+                "loop_start": state.metadata.get("iterations", 0), "best_draft": None,
+                "max_iterations_reached": False,
+                "speculative_served": False
+            },
+            "previous_drafts": [state.draft],  # append-only channel
             "draft": "",
+            "speculative": {},
             "user_action": ""
         }
 
@@ -44,14 +91,36 @@ def supervisor_agent(state):
     if not state.draft or state.draft.strip() == "":
         return {"metadata": {**state.metadata, "next_node": "drafter"}}
 
-    # If safety failed → rewrite
-    if not state.metadata.get("safety_pass", True):
-        return {"metadata": {**state.metadata, "next_node": "drafter"}}
+    # Remember the best-scoring draft of this loop for the terminal fallback
+    score = draft_score(state.metadata)
+    best = state.metadata.get("best_draft")
+    if best is None or score > best["score"]:
+        best = {
+            "draft": state.draft,
+            "score": score,
+            "safety_pass": state.metadata.get("safety_pass", True),
+            "critic_pass": state.metadata.get("critic_pass", True),
+        }
+    metadata = {**state.metadata, "best_draft": best}
 
-    # If critic failed → rewrite
-    if not state.metadata.get("critic_pass", True):
-        return {"metadata": {**state.metadata, "next_node": "drafter"}}
+    if metadata.get("safety_pass", True) and metadata.get("critic_pass", True):
+        # Everything good → ask human approval
+        return {"metadata": {**metadata, "next_node": "human_approval"}}
+
+    # Revision budget spent → stop looping, hand the best draft to the human
+    loop_iterations = metadata.get("iterations", 0) - metadata.get("loop_start", 0)
+    if loop_iterations >= MAX_ITERATIONS:
+        return {
+            "draft": best["draft"],
+            "metadata": {
+                **metadata,
+                "safety_pass": best["safety_pass"],
+                "critic_pass": best["critic_pass"],
+                "max_iterations_reached": True,
+                "next_node": "human_approval"
+            }
+        }
 
-    # Everything good → ask human approval
-    return {"metadata": {**state.metadata, "next_node": "human_approval"}}
+    # Safety or critic failed → rewrite
+    return {"metadata": {**metadata, "next_node": "drafter"}}
 
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from agent.llm_client import MODEL, generate_response, get_node_config
+from agent.verdicts import parse_verdict
+
+# Review verdict cache
+# - VERDICT_CACHE_SIZE: max entries kept in the in-memory LRU tier
+# - VERDICT_CACHE_TTL: seconds a verdict stays valid (both tiers)
+# - VERDICT_CACHE_POSTGRES: also persist verdicts in Postgres (shared across processes)
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "1024"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "86400"))
+VERDICT_CACHE_POSTGRES = os.getenv("VERDICT_CACHE_POSTGRES", "false").lower() == "true"
+# REVIEW_FAST_PATH: reviewers ask for a one-token verdict first (see review)
+REVIEW_FAST_PATH = os.getenv("REVIEW_FAST_PATH", "true").lower() == "true"
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (verdict, stored_at)
+_stats = {"hits": 0, "misses": 0, "postgres_hits": 0, "evictions": 0, "fast_pass": 0, "fast_fail": 0}
+_table_ready = False
+
+
+def make_key(template: str, draft: str, model: str = MODEL, temperature: float = 0.2,
+             max_tokens: int = None, stop=None, json_output: bool = False) -> str:
+    """
+    Content address for a review: prompt template, model parameters and
+    the draft with whitespace collapsed (so trivially re-flowed edits hit).
+    """
+    normalized = re.sub(r"\s+", " ", draft).strip()
+    payload = "\x1f".join([template, model, repr(temperature), repr(max_tokens), repr(stop), repr(json_output), normalized])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _memory_get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        verdict, stored_at = entry
+        if time.time() - stored_at > VERDICT_CACHE_TTL:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return verdict
+
+
+def _memory_put(key, verdict):
+    with _lock:
+        _entries[key] = (verdict, time.time())
+        _entries.move_to_end(key)
+        while len(_entries) > VERDICT_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS review_verdicts (
+                cache_key TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # Expire stale rows once per process
+        cur.execute(
+            "DELETE FROM review_verdicts WHERE created_at < NOW() - make_interval(secs => %s)",
+            (VERDICT_CACHE_TTL,)
+        )
+    _table_ready = True
+
+
+def _postgres_get(key):
+    from checkpoint_store import get_pool
+    try:
+        with get_pool().connection() as conn:
+            _ensure_table(conn)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT verdict FROM review_verdicts "
+                    "WHERE cache_key = %s AND created_at >= NOW() - make_interval(secs => %s)",
+                    (key, VERDICT_CACHE_TTL)
+                )
+                row = cur.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"Verdict cache lookup failed: {e}")
+        return None
+
+
+def _postgres_put(key, verdict):
+    from checkpoint_store import get_pool
+    try:
+        with get_pool().connection() as conn:
+            _ensure_table(conn)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO review_verdicts (cache_key, verdict) VALUES (%s, %s) "
+                    "ON CONFLICT (cache_key) DO UPDATE SET verdict = EXCLUDED.verdict, created_at = CURRENT_TIMESTAMP",
+                    (key, verdict)
+                )
+    except Exception as e:
+        print(f"Verdict cache write failed: {e}")
+
+
+def cached_review(template: str, draft: str, temperature: float = 0.2, model: str = MODEL,
+                  max_tokens: int = None, stop=None, json_output: bool = False) -> str:
+    """
+    Return the LLM review of `draft` under `template`, reusing a previous
+    verdict for the same (template, model parameters, draft) if cached.
+    """
+    key = make_key(template, draft, model, temperature, max_tokens, stop, json_output)
+
+    verdict = _memory_get(key)
+    if verdict is None and VERDICT_CACHE_POSTGRES:
+        verdict = _postgres_get(key)
+        if verdict is not None:
+            _memory_put(key, verdict)
+            with _lock:
+                _stats["postgres_hits"] += 1
+
+    if verdict is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return verdict
+
+    with _lock:
+        _stats["misses"] += 1
+
+    verdict = generate_response(template.format(draft=draft), temperature,
+                                model=model, max_tokens=max_tokens, stop=stop, json_output=json_output)
+    _memory_put(key, verdict)
+    if VERDICT_CACHE_POSTGRES:
+        _postgres_put(key, verdict)
+    return verdict
+
+
+def review(node: str, template: str, draft: str, verdict_template: str = None, passing: str = None) -> str:
+    """
+    Review `draft` with `node`'s model settings. With REVIEW_FAST_PATH and a
+    verdict_template, first ask for a one-token verdict: a pass returns
+    `passing` straight away, and only failures pay for the detailed review
+    (which still decides the outcome).
+    """
+    if REVIEW_FAST_PATH and verdict_template:
+        verdict = cached_review(verdict_template, draft, **get_node_config("verdict"))
+        if parse_verdict(verdict, passing)["passed"]:
+            with _lock:
+                _stats["fast_pass"] += 1
+            return passing
+        with _lock:
+            _stats["fast_fail"] += 1
+    return cached_review(template, draft, **get_node_config(node))
+
+
+def get_stats():
+    with _lock:
+        return {**_stats, "size": len(_entries)}
@@ -0,0 +1,87 @@
+import json
+import os
+import re
+
+# Reviewer verdict parsing
+# - REVIEW_MAX_ISSUES: issues kept per review note
+# - REVIEW_ISSUE_CHARS: each issue/fix is cut to this length in notes
+REVIEW_MAX_ISSUES = int(os.getenv("REVIEW_MAX_ISSUES", "5"))
+REVIEW_ISSUE_CHARS = int(os.getenv("REVIEW_ISSUE_CHARS", "160"))
+
+SEVERITIES = ("none", "low", "medium", "high")
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_FIRST_WORD = re.compile(r"[^A-Za-z]*([A-Za-z]+)")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)")
+
+
+def parse_verdict(text, passing):
+    """
+    Parse a reviewer reply into {"passed", "severity", "issues"} where
+    issues is [{"issue", "fix"}]. Accepts the JSON the review prompts ask
+    for (also wrapped in code fences or after a preamble); anything else
+    is read as free text that passes if its first word is `passing`
+    (so "SAFE.", "**GOOD**" or "safe" are not false failures). In both
+    forms a verdict that still lists issues is not a pass.
+    """
+    text = (text or "").strip()
+    data = _load_json(text)
+    if data is not None:
+        verdict = str(data.get("verdict", "")).strip().strip(".").upper()
+        raw_issues = data.get("issues")
+        issues = [_issue(item) for item in raw_issues] if isinstance(raw_issues, list) else []
+        issues = [item for item in issues if item["issue"]]
+        severity = str(data.get("severity", "")).lower()
+        passed = verdict == passing and not issues
+    else:
+        match = _FIRST_WORD.match(text)
+        first_word = match.group(1).upper() if match else ""
+        items = [m.group(1) for m in map(_LIST_ITEM.match, text.splitlines()) if m]
+        # "SAFE" followed by a list of problems is not a pass
+        passed = first_word == passing and not items
+        issues = [{"issue": item, "fix": ""} for item in items]
+        if not passed and not issues and text:
+            issues = [{"issue": text, "fix": ""}]
+        severity = ""
+
+    if severity not in SEVERITIES:
+        severity = "none" if passed else "medium"
+    if not passed and not issues:
+        issues = [{"issue": "Reviewer flagged the draft without details", "fix": ""}]
+    return {"passed": passed, "severity": severity, "issues": issues}
+
+
+def _load_json(text):
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _issue(item):
+    if isinstance(item, dict):
+        return {"issue": str(item.get("issue", "")).strip(), "fix": str(item.get("fix", "")).strip()}
+    return {"issue": str(item).strip(), "fix": ""}
+
+
+def _clip(text):
+    return text if len(text) <= REVIEW_ISSUE_CHARS else text[:REVIEW_ISSUE_CHARS - 3].rstrip() + "..."
+
+
+def format_notes(verdict):
+    """Compact note text for a failed verdict: severity line plus one line per issue."""
+    issues = verdict["issues"][:REVIEW_MAX_ISSUES]
+    lines = [f"Severity: {verdict['severity']}"]
+    for item in issues:
+        line = f"- {_clip(item['issue'])}"
+        if item["fix"]:
+            line += f" (fix: {_clip(item['fix'])})"
+        lines.append(line)
+    hidden = len(verdict["issues"]) - len(issues)
+    if hidden > 0:
+        lines.append(f"- ...and {hidden} more")
+    return "\n".join(lines)
@@ -0,0 +1,214 @@
+"""
+Cerina - ASGI entry point.
+
+Serves the same API as main.py, with the request paths that wait on the
+graph (/generate, /stream, /stream/<thread_id>, /action) implemented
+natively on the event loop: ainvoke/astream against an AsyncPostgresSaver
+on an AsyncConnectionPool, and SSE responses that await new events rather
+than holding a thread per client. Every other route is served by the
+Flask app itself, mounted as WSGI, so payloads stay identical.
+
+Graph nodes are still synchronous; LangGraph runs them on the loop's
+default executor, sized by ASGI_NODE_THREADS.
+
+    uvicorn asgi:app --port 5000
+    gunicorn -c gunicorn.conf.py      # production (see gunicorn.conf.py on scaling out)
+"""
+
+import asyncio
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from main import app as flask_app, init_db, _build_response, _build_action_response, _queue_generation
+from graph_builder import aget_graph, run_config
+from state import initial_state
+from checkpoint_store import close_async_pool
+from session_store import save_session_metadata, save_exercise
+from retention import start_sweeper
+from stream_runner import start_async_run, get_run, parse_event_id, asse_frames
+from jobs import QueueFull
+import speculative
+
+# - ASGI_NODE_THREADS: threads running (synchronous) graph nodes per worker;
+#   bounds concurrent node work, not the number of open streams
+ASGI_NODE_THREADS = int(os.getenv("ASGI_NODE_THREADS", "32"))
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def generate(request):
+    """
+    /generate (see main.generate). The synchronous path awaits ainvoke;
+    {"async": true} queues the same job as the Flask route.
+    """
+    try:
+        data = await _json_body(request)
+        if data is None:
+            return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+        user_query = data.get('user_query', '').strip()
+        thread_id = data.get('thread_id', 'default-thread')
+
+        if not user_query:
+            return JSONResponse({'error': 'No query provided'}, status_code=400)
+
+        callback_url = data.get('callback_url')
+        if callback_url and not callback_url.startswith(('http://', 'https://')):
+            return JSONResponse({'error': 'callback_url must be an http(s) URL'}, status_code=400)
+
+        if data.get('async'):
+            try:
+                job_id = await run_in_threadpool(_queue_generation, user_query, thread_id, callback_url)
+            except QueueFull as e:
+                return JSONResponse({'error': f"Job queue is full: {e}"}, status_code=429,
+                                    headers={'Retry-After': '5'})
+            return JSONResponse({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/jobs/{job_id}",
+                'thread_id': thread_id
+            }, status_code=202)
+
+        await run_in_threadpool(save_session_metadata, thread_id, user_query)
+
+        config = run_config(thread_id)
+        graph = await aget_graph()
+        result = await graph.ainvoke(initial_state(user_query), config=config)
+        return JSONResponse(_build_response(result, thread_id))
+
+    except Exception as e:
+        print(f"Error in /generate: {str(e)}")
+        traceback.print_exc()
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def stream_generate(request):
+    """/stream (see main.stream_generate), run as an asyncio task."""
+    data = await _json_body(request)
+    if data is None:
+        return JSONResponse({'error': 'Invalid request: expected a JSON object'}, status_code=400)
+    user_query = data.get('user_query', '').strip()
+    thread_id = data.get('thread_id', 'default-thread')
+
+    try:
+        await run_in_threadpool(save_session_metadata, thread_id, user_query)
+    except Exception as e:
+        return JSONResponse({'error': f"Invalid request: {str(e)}"}, status_code=400)
+
+    if not user_query:
+        return Response(f"data: {json.dumps({'error': 'No query provided'})}\n\n", media_type='text/event-stream')
+
+    run = start_async_run(thread_id, initial_state(user_query))
+    if run is None:
+        return JSONResponse({'error': 'Too many concurrent streams, retry shortly'}, status_code=503,
+                            headers={'Retry-After': '5'})
+
+    return StreamingResponse(asse_frames(run), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def resume_stream(request):
+    """/stream/<thread_id> (see main.resume_stream)."""
+    run = get_run(request.path_params['thread_id'])
+    if run is None:
+        return JSONResponse({'error': 'No active stream for this thread'}, status_code=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    return StreamingResponse(
+        asse_frames(run, parse_event_id(run, last_event_id)),
+        media_type='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+
+async def handle_action(request):
+    """/action (see main.handle_action), resumed with ainvoke."""
+    try:
+        data = await _json_body(request)
+        if data is None:
+            return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+        thread_id = data.get('thread_id', 'default-thread')
+        action = data.get('action')
+        edited_text = data.get('edited_text', '')
+
+        if not action:
+            return JSONResponse({'error': 'No action specified'}, status_code=400)
+
+        config = run_config(thread_id, speculate=True)
+
+        # Same ordering as the Flask route: no speculative write may land meanwhile
+        await run_in_threadpool(
+            speculative.cancel, thread_id,
+            wait=speculative.SPECULATIVE_REJECT_WAIT if action == 'reject' else 0
+        )
+
+        update = {'user_action': action}
+        if action == 'edit':
+            update['edited_text'] = edited_text
+
+        graph = await aget_graph()
+        result = await graph.ainvoke(update, config=config)
+        result_dict = result if isinstance(result, dict) else result.dict()
+
+        if action == 'approve' and result_dict.get('final_output', '') != '':
+            await run_in_threadpool(save_exercise, thread_id, result_dict)
+
+        return JSONResponse(_build_action_response(result_dict, action))
+
+    except Exception as e:
+        print(f"Error in /action: {str(e)}")
+        traceback.print_exc()
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Bounded executor for graph nodes (stream I/O has its own, see stream_runner)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=ASGI_NODE_THREADS, thread_name_prefix="cerina-node"))
+    try:
+        await run_in_threadpool(init_db)
+        print("✅ DB Connection Pool Initialized & Tables Verified")
+        # Open the async pool and compile the graph before the first request
+        await aget_graph()
+        start_sweeper()
+    except Exception as e:
+        print(f"⚠️ DB Setup Failed: {e}")
+    yield
+    await close_async_pool()
+
+
+app = Starlette(
+    routes=[
+        Route('/generate', generate, methods=['POST']),
+        Route('/stream', stream_generate, methods=['POST']),
+        Route('/stream/{thread_id}', resume_stream, methods=['GET']),
+        Route('/action', handle_action, methods=['POST']),
+        # Everything else: the Flask app, unchanged
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Starting Cerina - AI CBT Exercise Creator (ASGI)")
+    print("📍 Server running at: http://localhost:5000")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,187 @@
+"""
+Cerina - bulk exercise generation.
+
+Runs the drafter/safety/critic graph over a JSONL file of topics and
+writes one JSONL result per topic as each finishes.
+
+    python batch.py topics.jsonl --concurrency 8 --auto-approve --output results.jsonl
+
+Each input line is a JSON object with "topic" (or "user_query"), optional
+"instructions", and an optional "id". Items are keyed to a deterministic
+thread_id, so re-running the same file after a crash resumes unfinished
+items from their last checkpoint and skips finished ones.
+The same runner backs POST /batch in main.py.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from graph_builder import get_graph, run_config
+from state import initial_state
+from session_store import save_session_metadata, save_exercise
+
+# - BATCH_CONCURRENCY: default concurrent items
+# - BATCH_MAX_CONCURRENCY: upper bound accepted from callers
+# - BATCH_RETRIES: default extra attempts per failed item
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "2"))
+
+
+def item_query(item):
+    """Build the user query the same way the MCP tool does."""
+    if item.get('user_query'):
+        return str(item['user_query']).strip()
+    topic = str(item.get('topic', '')).strip()
+    if not topic:
+        return ''
+    return f"{topic}. {item.get('instructions', '')}".strip()
+
+
+def item_thread_id(item, query):
+    key = str(item.get('id') or hashlib.sha1(query.encode('utf-8')).hexdigest()[:16])
+    return f"batch-{key}"
+
+
+def _summary(item_id, thread_id, status, values, attempts, error=None):
+    metadata = values.get('metadata', {}) if values else {}
+    return {
+        'id': item_id,
+        'thread_id': thread_id,
+        'status': status,
+        'draft': values.get('draft', '') if values else '',
+        'final_output': values.get('final_output', '') if values else '',
+        'iterations': metadata.get('iterations', 0),
+        'safety_pass': metadata.get('safety_pass'),
+        'critic_pass': metadata.get('critic_pass'),
+        'attempts': attempts,
+        'error': error
+    }
+
+
+def run_item(item, auto_approve=False, retries=BATCH_RETRIES):
+    """
+    Generate (or resume) one item and optionally approve it into
+    saved_exercises. Never raises: failures are reported in the result.
+    """
+    if not isinstance(item, dict):
+        return _summary(None, None, 'invalid', None, 0, 'Item is not a JSON object')
+    query = item_query(item)
+    if not query:
+        return _summary(item.get('id'), None, 'invalid', None, 0, 'No topic or user_query')
+    thread_id = item_thread_id(item, query)
+    item_id = item.get('id', thread_id)
+    config = run_config(thread_id)
+    graph = get_graph()
+
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            snapshot = graph.get_state(config)
+            values = snapshot.values or {}
+
+            if values.get('final_output'):
+                return _summary(item_id, thread_id, 'approved', values, attempt)
+
+            if values and snapshot.next:
+                # Interrupted mid-run (crash or earlier failure): resume
+                values = graph.invoke(None, config=config)
+            elif not values.get('draft'):
+                save_session_metadata(thread_id, query)
+                values = graph.invoke(initial_state(query), config=config)
+
+            metadata = values.get('metadata', {})
+            passed = metadata.get('safety_pass') and metadata.get('critic_pass')
+            if auto_approve and passed and metadata.get('next_node') == 'human_approval':
+                values = graph.invoke({'user_action': 'approve'}, config=config)
+                save_exercise(thread_id, values)
+                return _summary(item_id, thread_id, 'approved', values, attempt)
+
+            return _summary(item_id, thread_id, 'drafted' if passed else 'needs_review', values, attempt)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Batch item {item_id} attempt {attempt} failed: {error}", file=sys.stderr)
+            traceback.print_exc()
+            if attempt <= retries:
+                time.sleep(min(2 ** attempt, 30))
+
+    return _summary(item_id, thread_id, 'failed', None, retries + 1, error)
+
+
+def run_batch(items, concurrency=BATCH_CONCURRENCY, auto_approve=False, retries=BATCH_RETRIES):
+    """
+    Yield one result dict per item, in completion order. At most
+    2 x concurrency items are in memory at once, so `items` may be a
+    lazily-read iterator over a very large file.
+    """
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cerina-batch") as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < concurrency * 2:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(run_item, item, auto_approve, retries))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def read_items(lines):
+    """Parse JSONL lines; malformed lines and non-objects become 'invalid' items."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'topic': item}
+        except json.JSONDecodeError:
+            item = None
+        if not isinstance(item, dict):
+            item = {'id': f"line-{number}", 'topic': ''}
+        yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate CBT exercises for a JSONL file of topics.")
+    parser.add_argument("input", help="JSONL file of topics ('-' for stdin)")
+    parser.add_argument("--output", "-o", help="append JSONL results here (default: stdout)")
+    parser.add_argument("--concurrency", "-c", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES)
+    parser.add_argument("--auto-approve", action="store_true",
+                        help="approve drafts that passed safety and critic into saved_exercises")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    sink = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    counts = {}
+    try:
+        for result in run_batch(read_items(source), args.concurrency, args.auto_approve, args.retries):
+            sink.write(json.dumps(result) + "\n")
+            sink.flush()
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    print(f"Batch finished: {counts}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
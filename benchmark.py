@@ -0,0 +1,280 @@
+"""
+Cerina - offline benchmark harness.
+
+Drives /generate, /stream, /action and the MCP tool in-process (Flask
+test client) at increasing concurrency against the fake LLM backend and
+a local Postgres, and reports latency percentiles, throughput, checkpoint
+write volume and memory. LLM time is fixed by FAKE_LLM_* settings, so
+changes in the numbers are graph, checkpoint and streaming overhead.
+
+    python benchmark.py --concurrency 1,4,16 --requests 32 --json bench.json
+    python benchmark.py --baseline bench.json   # exit 1 on p95/throughput regression
+
+Point DB_* / DATABASE_URL at a scratch database: every run adds sessions.
+
+Requests refused for capacity (503/429, e.g. /stream above STREAM_MAX_WORKERS)
+are reported as `rejected`, not as errors, and are left out of the latency
+and throughput numbers. Raise STREAM_MAX_WORKERS to measure /stream at
+higher concurrency.
+"""
+
+import os
+
+# Must be set before the agents import llm_client
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import argparse
+import codecs
+import json
+import resource
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoint_store import get_pool
+from main import app, init_db
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MCP'))
+
+SCENARIOS = ("generate", "stream", "action", "mcp")
+CHECKPOINT_TABLES = ("checkpoints", "checkpoint_blobs", "checkpoint_writes")
+
+
+def _query(prefix, i):
+    # Unique per request so the semantic/verdict caches don't hide graph cost
+    return f"{prefix} {i}: a short exercise for exam anxiety"
+
+
+class Rejected(Exception):
+    """The server refused the request for capacity (503/429); counted apart from errors."""
+
+
+def _post(client, path, body):
+    response = client.post(path, json=body)
+    if response.status_code in (429, 503):
+        raise Rejected(f"{path} returned {response.status_code}")
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response.get_json()
+
+
+def run_generate(client, run_id, i):
+    _post(client, '/generate', {'user_query': _query(run_id, i), 'thread_id': f"bench-{run_id}-g{i}"})
+    return {}
+
+
+def _sse_events(chunks):
+    """Yield the parsed `data:` payload of each SSE frame (frames may span chunks)."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ""
+    for chunk in chunks:
+        buffer += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        *frames, buffer = buffer.split("\n\n")
+        for frame in frames:
+            for line in frame.splitlines():
+                if line.startswith("data:"):
+                    yield json.loads(line[5:])
+
+
+def run_stream(client, run_id, i):
+    """Consume the SSE stream; also reports time to first token."""
+    start = time.perf_counter()
+    response = client.post('/stream', json={'user_query': _query(run_id, i), 'thread_id': f"bench-{run_id}-s{i}"},
+                           buffered=False)
+    if response.status_code == 503:
+        raise Rejected("/stream returned 503 (STREAM_MAX_WORKERS busy)")
+    if response.status_code != 200:
+        raise RuntimeError(f"/stream returned {response.status_code}")
+    first_token = None
+    try:
+        for event in _sse_events(response.response):
+            if first_token is None and event.get('type') == 'token':
+                first_token = time.perf_counter() - start
+            if event.get('type') == 'error' or 'error' in event:
+                raise RuntimeError(f"/stream error event: {json.dumps(event)[:200]}")
+    finally:
+        response.close()
+    return {'ttft': first_token}
+
+
+def setup_action(client, run_id, i):
+    thread_id = f"bench-{run_id}-a{i}"
+    _post(client, '/generate', {'user_query': _query(run_id, i), 'thread_id': thread_id})
+    return thread_id
+
+
+def run_action(client, run_id, i, thread_id):
+    result = _post(client, '/action', {'thread_id': thread_id, 'action': 'approve'})
+    if not result.get('approved'):
+        raise RuntimeError(f"approve did not finalize {thread_id}")
+    return {}
+
+
+def run_mcp(client, run_id, i):
+    from cerina_mcp_tools import generate_cbt_exercise
+    result = generate_cbt_exercise(f"{run_id} {i}: exam anxiety", "keep it short")
+    if result.startswith("Error"):
+        raise RuntimeError(result[:200])
+    return {}
+
+
+def checkpoint_volume():
+    """Rows and on-disk bytes of the checkpoint tables."""
+    volume = {}
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            for table in CHECKPOINT_TABLES:
+                cur.execute(f"SELECT count(*), pg_total_relation_size('{table}') FROM {table}")
+                rows, size = cur.fetchone()
+                volume[table] = {'rows': rows, 'bytes': size}
+    return volume
+
+
+def _volume_delta(before, after):
+    return {
+        table: {key: after[table][key] - before[table][key] for key in ('rows', 'bytes')}
+        for table in CHECKPOINT_TABLES
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_level(scenario, concurrency, requests):
+    """Run `requests` calls of one scenario with `concurrency` in flight."""
+    client = app.test_client()
+    run_id = f"{scenario}-c{concurrency}-{uuid.uuid4().hex[:6]}"
+
+    # /action needs sessions paused at human_approval; create them untimed
+    prepared = {}
+    if scenario == 'action':
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            prepared = dict(enumerate(executor.map(lambda i: setup_action(client, run_id, i), range(requests))))
+
+    runner = {'generate': run_generate, 'stream': run_stream, 'action': run_action, 'mcp': run_mcp}[scenario]
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            extra = runner(client, run_id, i, prepared[i]) if scenario == 'action' else runner(client, run_id, i)
+            return time.perf_counter() - start, extra, None
+        except Rejected:
+            return time.perf_counter() - start, {'rejected': True}, 'rejected'
+        except Exception as e:
+            return time.perf_counter() - start, {}, f"{type(e).__name__}: {e}"
+
+    volume_before = checkpoint_volume()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    wall = time.perf_counter() - wall_start
+    volume = _volume_delta(volume_before, checkpoint_volume())
+
+    latencies = [latency for latency, _, error in results if error is None]
+    rejected = sum(1 for _, extra, _ in results if extra.get('rejected'))
+    errors = [error for _, extra, error in results if error is not None and not extra.get('rejected')]
+    ttfts = [extra['ttft'] for _, extra, error in results if error is None and extra.get('ttft') is not None]
+    for error in errors[:3]:
+        print(f"  {scenario} c={concurrency} error: {error}", file=sys.stderr)
+
+    ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': len(errors),
+        'rejected': rejected,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'ttft_p50_ms': ms(percentile(ttfts, 50)),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else None,
+        'checkpoint_rows': sum(v['rows'] for v in volume.values()),
+        'checkpoint_bytes': sum(v['bytes'] for v in volume.values()),
+        'checkpoint_bytes_per_request': round(sum(v['bytes'] for v in volume.values()) / requests) if requests else None,
+        'checkpoint_tables': volume,
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def print_report(results):
+    columns = ('scenario', 'concurrency', 'errors', 'rejected', 'p50_ms', 'p95_ms', 'p99_ms', 'ttft_p50_ms',
+               'throughput_rps', 'checkpoint_rows', 'checkpoint_bytes_per_request', 'peak_rss_mb')
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions vs a previous --json report (p95 up or throughput down by > tolerance)."""
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r['scenario'], r['concurrency']))
+        if not old:
+            continue
+        if old['p95_ms'] and r['p95_ms'] and r['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: p95 {old['p95_ms']} -> {r['p95_ms']} ms")
+        if old['throughput_rps'] and r['throughput_rps'] is not None and r['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: throughput {old['throughput_rps']} -> {r['throughput_rps']} rps")
+        if r['errors'] > old['errors']:
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: errors {old['errors']} -> {r['errors']}")
+        if r.get('rejected', 0) > old.get('rejected', 0):
+            regressions.append(f"{r['scenario']} c={r['concurrency']}: rejected {old.get('rejected', 0)} -> {r['rejected']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Cerina's graph, checkpoint and streaming overhead.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="requests per scenario and level")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="previous --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"LLM backend: {os.environ['LLM_BACKEND']}", file=sys.stderr)
+    init_db()
+
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            print(f"Running {scenario} at concurrency {concurrency}...", file=sys.stderr)
+            results.append(run_level(scenario, concurrency, args.requests))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
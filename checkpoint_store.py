@@ -1,39 +1,238 @@
 from langgraph.checkpoint.postgres import PostgresSaver
-from psycopg_pool import ConnectionPool
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 from db.config import get_connection_string
 from contextlib import contextmanager
+import asyncio
 import atexit
+import os
+import threading
+import time
+import weakref
+import metrics
+
+# Connection pool settings (sync pool and the ASGI app's async pool alike)
+# - DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE: connections kept open / upper bound
+# - DB_POOL_TIMEOUT: seconds a checkout may wait for a connection
+# - DB_POOL_MAX_IDLE: close connections above min_size idle this long
+# - DB_POOL_MAX_LIFETIME: replace connections older than this
+# - DB_POOL_CHECK_IDLE: health-check a connection on checkout only if it sat
+#   in the pool this many seconds (0: check every checkout, -1: never)
+# - DB_POOL_WARMUP: open min_size connections before the pool is first used,
+#   waiting up to DB_POOL_WARMUP_TIMEOUT seconds
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+DB_POOL_WARMUP = os.getenv("DB_POOL_WARMUP", "true").lower() == "true"
+DB_POOL_WARMUP_TIMEOUT = float(os.getenv("DB_POOL_WARMUP_TIMEOUT", "30"))
 
 # Global connection pool
 _pool = None
+_pool_lock = threading.Lock()
+
+# Process-wide checkpointer bound to the pool (not to a single connection)
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+# Async pool + checkpointer for the ASGI app (asgi.py), created on its event loop
+_async_pool = None
+_async_checkpointer = None
+_async_lock = asyncio.Lock()
+
+class _IdleCheck:
+    """
+    Pool mixin: skip the health-check round trip for connections that were
+    returned less than DB_POOL_CHECK_IDLE seconds ago (a connection that
+    was just working is very likely still alive). Adds checks_run and
+    checks_skipped to get_stats().
+    """
+
+    def _setup_idle_check(self, kwargs):
+        self._returned_at = weakref.WeakKeyDictionary()
+        self._check_counts = {"checks_run": 0, "checks_skipped": 0}
+        self._check_counts_lock = threading.Lock()
+        if DB_POOL_CHECK_IDLE >= 0:
+            kwargs["check"] = self._check_if_idle
+
+    def _needs_check(self, conn):
+        returned_at = self._returned_at.get(conn)
+        needed = returned_at is None or time.monotonic() - returned_at >= DB_POOL_CHECK_IDLE
+        with self._check_counts_lock:
+            self._check_counts["checks_run" if needed else "checks_skipped"] += 1
+        return needed
+
+    def _mark_returned(self, conn):
+        self._returned_at[conn] = time.monotonic()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self._check_counts_lock:
+            stats.update(self._check_counts)
+        return stats
+
+
+class InstrumentedConnectionPool(_IdleCheck, ConnectionPool):
+    """ConnectionPool that records checkout waits and checks only idle connections."""
+
+    def __init__(self, *args, **kwargs):
+        self._setup_idle_check(kwargs)
+        super().__init__(*args, **kwargs)
+
+    def _check_if_idle(self, conn):
+        if self._needs_check(conn):
+            ConnectionPool.check_connection(conn)
+
+    def getconn(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            return super().getconn(timeout=timeout)
+        finally:
+            metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    def putconn(self, conn):
+        self._mark_returned(conn)
+        super().putconn(conn)
+
+
+class InstrumentedAsyncConnectionPool(_IdleCheck, AsyncConnectionPool):
+    """Async counterpart of InstrumentedConnectionPool."""
+
+    def __init__(self, *args, **kwargs):
+        self._setup_idle_check(kwargs)
+        super().__init__(*args, **kwargs)
+
+    async def _check_if_idle(self, conn):
+        if self._needs_check(conn):
+            await AsyncConnectionPool.check_connection(conn)
+
+    async def getconn(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            return await super().getconn(timeout=timeout)
+        finally:
+            metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    async def putconn(self, conn):
+        self._mark_returned(conn)
+        await super().putconn(conn)
+
+
+# The savers run each statement in its own transaction and need autocommit
+# connections; code that needs atomicity uses conn.transaction() explicitly
+_CONNECTION_KWARGS = {"autocommit": True, "prepare_threshold": 0}
+
+
+def _pool_settings():
+    return {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": DB_POOL_TIMEOUT,
+        "max_idle": DB_POOL_MAX_IDLE,
+        "max_lifetime": DB_POOL_MAX_LIFETIME,
+    }
+
+
+class _SerializedSizeMetrics:
+    """Saver mixin: sizes come from the rows the saver already serialized for the insert."""
+
+    def _dump_blobs(self, *args, **kwargs):
+        rows = super()._dump_blobs(*args, **kwargs)
+        metrics.CHECKPOINT_BYTES.labels("put").observe(metrics.serialized_size(rows))
+        return rows
+
+    def _dump_writes(self, *args, **kwargs):
+        rows = super()._dump_writes(*args, **kwargs)
+        metrics.CHECKPOINT_BYTES.labels("put_writes").observe(metrics.serialized_size(rows))
+        return rows
+
+
+class InstrumentedPostgresSaver(_SerializedSizeMetrics, PostgresSaver):
+    """PostgresSaver that records read/write latency and serialized sizes."""
+
+    def get_tuple(self, config):
+        with metrics.CHECKPOINT_SECONDS.labels("get").time():
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with metrics.CHECKPOINT_SECONDS.labels("put").time():
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        with metrics.CHECKPOINT_SECONDS.labels("put_writes").time():
+            return super().put_writes(config, writes, task_id, *args, **kwargs)
+
+
+class InstrumentedAsyncPostgresSaver(_SerializedSizeMetrics, AsyncPostgresSaver):
+    """AsyncPostgresSaver with the same latency and size metrics."""
+
+    async def aget_tuple(self, config):
+        with metrics.CHECKPOINT_SECONDS.labels("get").time():
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with metrics.CHECKPOINT_SECONDS.labels("put").time():
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        with metrics.CHECKPOINT_SECONDS.labels("put_writes").time():
+            return await super().aput_writes(config, writes, task_id, *args, **kwargs)
+
 
 def get_pool():
     global _pool
     if _pool is None:
-        connection_string = get_connection_string()
-        # Initialize the pool with proper connection management
-        # - min_size: minimum connections to keep alive
-        # - max_size: maximum concurrent connections
-        # - max_idle: recycle connections idle for more than 5 minutes (300 seconds)
-        # - timeout: wait up to 30 seconds for a connection
-        # - check: validate connection health before returning it
-        _pool = ConnectionPool(
-            conninfo=connection_string,
-            min_size=2,
-            max_size=20,
-            max_idle=300,  # Close connections idle for 5+ minutes
-            timeout=30,
-            check=ConnectionPool.check_connection  # Validate connections before use
-        )
-        
-        # Ensure tables are created once at startup
-        with _pool.connection() as conn:
-            conn.autocommit = True
-            checkpointer = PostgresSaver(conn)
-            checkpointer.setup()
-            
+        with _pool_lock:
+            if _pool is None:
+                # Sizing, recycling and health checks come from DB_POOL_* (see top)
+                pool = InstrumentedConnectionPool(
+                    conninfo=get_connection_string(),
+                    kwargs=_CONNECTION_KWARGS,
+                    open=False,
+                    **_pool_settings()
+                )
+                try:
+                    # Warmup: the first requests don't pay for connecting
+                    pool.open(wait=DB_POOL_WARMUP, timeout=DB_POOL_WARMUP_TIMEOUT)
+
+                    # Ensure tables are created once at startup
+                    with pool.connection() as conn:
+                        checkpointer = PostgresSaver(conn)
+                        checkpointer.setup()
+                except Exception:
+                    pool.close()
+                    raise
+
+                metrics.register_pool(pool, "sync")
+                _pool = pool
     return _pool
 
+async def get_async_pool():
+    """
+    Async counterpart of get_pool for the ASGI app. Tables are created by
+    get_pool (init_db), so this only opens the pool.
+    """
+    global _async_pool
+    if _async_pool is None:
+        async with _async_lock:
+            if _async_pool is None:
+                pool = InstrumentedAsyncConnectionPool(
+                    conninfo=get_connection_string(),
+                    kwargs=_CONNECTION_KWARGS,
+                    open=False,
+                    **_pool_settings()
+                )
+                try:
+                    await pool.open(wait=DB_POOL_WARMUP, timeout=DB_POOL_WARMUP_TIMEOUT)
+                except Exception:
+                    await pool.close()
+                    raise
+                metrics.register_pool(pool, "async")
+                _async_pool = pool
+    return _async_pool
+
 @contextmanager
 def get_checkpointer_context():
     """
@@ -45,12 +244,47 @@ def get_checkpointer_context():
     """
     pool = get_pool()
     with pool.connection() as conn:
-        # conn.autocommit = True  # PostgresSaver usually handles transactions, but safe ensuring it works
         yield PostgresSaver(conn)
 
+def get_checkpointer():
+    """
+    Return the process-wide PostgresSaver bound to the connection pool.
+    Each checkpoint read/write checks out its own connection, so a single
+    saver (and a single compiled graph) can be shared across request threads.
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        with _checkpointer_lock:
+            if _checkpointer is None:
+                _checkpointer = InstrumentedPostgresSaver(get_pool())
+    return _checkpointer
+
+async def get_async_checkpointer():
+    """Process-wide AsyncPostgresSaver bound to the async pool."""
+    global _async_checkpointer
+    if _async_checkpointer is None:
+        _async_checkpointer = InstrumentedAsyncPostgresSaver(await get_async_pool())
+    return _async_checkpointer
+
+def get_pool_stats():
+    """Pool settings plus live counters of each open pool (for /health)."""
+    stats = {"settings": {**_pool_settings(), "check_idle": DB_POOL_CHECK_IDLE, "warmup": DB_POOL_WARMUP}}
+    if _pool is not None:
+        stats["sync"] = _pool.get_stats()
+    if _async_pool is not None:
+        stats["async"] = _async_pool.get_stats()
+    return stats
+
 def close_pool():
     global _pool
     if _pool is not None:
         _pool.close()
 
+async def close_async_pool():
+    global _async_pool, _async_checkpointer
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+        _async_checkpointer = None
+
 atexit.register(close_pool)
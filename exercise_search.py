@@ -0,0 +1,170 @@
+"""
+Search and export over saved_exercises.
+
+Full-text search uses a generated tsvector column (query weighted above
+content) with a GIN index; with SEARCH_TRIGRAM=true, pg_trgm similarity
+on the query text also matches typos and partial words. Export streams
+rows through a server-side cursor, so memory stays flat for any table size.
+"""
+
+import html
+import json
+import os
+
+from psycopg import sql
+
+from checkpoint_store import get_pool
+
+# - SEARCH_LANGUAGE: text search configuration for the tsvector column
+# - SEARCH_TRIGRAM: enable pg_trgm similarity matching (needs CREATE EXTENSION rights)
+# - EXPORT_FETCH_SIZE: rows fetched per round trip by the export cursor
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+SEARCH_TRIGRAM = os.getenv("SEARCH_TRIGRAM", "false").lower() == "true"
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "500"))
+
+# Whether pg_trgm is actually installed (None: not checked yet)
+_trigram_ready = None
+
+# ts_headline returns stored text unescaped, so it marks matches with
+# control-character sentinels; _highlight escapes, then swaps in <mark>
+_MARK_START, _MARK_STOP = '\x01', '\x02'
+_TITLE_OPTIONS = f'HighlightAll=true, StartSel="{_MARK_START}", StopSel="{_MARK_STOP}"'
+_SNIPPET_OPTIONS = ('MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=" ... ", '
+                    f'StartSel="{_MARK_START}", StopSel="{_MARK_STOP}"')
+
+
+def ensure_schema():
+    """
+    Add the search column and indexes (idempotent; called from init_db).
+    Raises ValueError if SEARCH_LANGUAGE is not a text search configuration.
+    """
+    global _trigram_ready
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", (SEARCH_LANGUAGE,))
+            if cur.fetchone() is None:
+                raise ValueError(f"SEARCH_LANGUAGE {SEARCH_LANGUAGE!r} is not a text search configuration")
+            # DDL takes no parameters; the validated name goes in as a quoted literal
+            cur.execute(sql.SQL("""
+                ALTER TABLE saved_exercises ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector({language}::regconfig, coalesce(query, '')), 'A') ||
+                    setweight(to_tsvector({language}::regconfig, coalesce(content, '')), 'B')
+                ) STORED
+            """).format(language=sql.Literal(SEARCH_LANGUAGE)))
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS saved_exercises_search_idx
+                ON saved_exercises USING GIN (search_vector)
+            """)
+            if SEARCH_TRIGRAM:
+                try:
+                    with conn.transaction():
+                        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                        cur.execute("""
+                            CREATE INDEX IF NOT EXISTS saved_exercises_query_trgm_idx
+                            ON saved_exercises USING GIN (query gin_trgm_ops)
+                        """)
+                    _trigram_ready = True
+                except Exception as e:
+                    _trigram_ready = False
+                    print(f"pg_trgm unavailable, trigram search disabled: {e}")
+
+
+def _trigram_enabled(cur):
+    global _trigram_ready
+    if not SEARCH_TRIGRAM:
+        return False
+    if _trigram_ready is None:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _trigram_ready = cur.fetchone() is not None
+    return _trigram_ready
+
+
+def search_exercises(text, limit=20, offset=0, safe_only=True):
+    """
+    Ranked matches for `text` (websearch syntax: "quoted phrases", -exclude, or).
+    Returns [{id, thread_id, query, created_at, rank, title, snippet}];
+    title and snippet are HTML-escaped, with matches in <mark>...</mark>.
+    """
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                _search_sql(_trigram_enabled(cur), safe_only),
+                (SEARCH_LANGUAGE, text, text, limit, offset, _TITLE_OPTIONS, _SNIPPET_OPTIONS)
+            )
+            rows = cur.fetchall()
+
+    return [
+        {
+            'id': id_,
+            'thread_id': thread_id,
+            'query': query,
+            'created_at': created_at.isoformat() if created_at else None,
+            'rank': round(float(rank), 4),
+            'title': _highlight(title),
+            'snippet': _highlight(snippet)
+        }
+        for id_, thread_id, query, created_at, rank, title, snippet in rows
+    ]
+
+
+def _highlight(fragment):
+    return html.escape(fragment).replace(_MARK_START, '<mark>').replace(_MARK_STOP, '</mark>')
+
+
+def _search_sql(trigram, safe_only):
+    match = "search_vector @@ q.tsq" + (" OR query %% q.raw" if trigram else "")
+    rank = "ts_rank_cd(search_vector, q.tsq)" + (", similarity(query, q.raw)" if trigram else "")
+    safe = "AND safety_pass IS NOT FALSE" if safe_only else ""
+
+    # Rank and page first; ts_headline (the expensive part) only runs on the page
+    return f"""
+        WITH cfg AS (SELECT %s::regconfig AS lang),
+        q AS (SELECT lang, websearch_to_tsquery(lang, %s) AS tsq, %s::text AS raw FROM cfg),
+        page AS (
+            SELECT id, thread_id, query, content, created_at, greatest({rank}) AS rank
+            FROM saved_exercises, q
+            WHERE ({match}) {safe}
+            ORDER BY rank DESC, id DESC
+            LIMIT %s OFFSET %s
+        )
+        SELECT page.id, page.thread_id, page.query, page.created_at, page.rank,
+               ts_headline(q.lang, coalesce(page.query, ''), q.tsq, %s),
+               ts_headline(q.lang, coalesce(page.content, ''), q.tsq, %s)
+        FROM page, q
+        ORDER BY page.rank DESC, page.id DESC
+    """
+
+
+def export_exercises(text=None, safe_only=True):
+    """
+    Yield one NDJSON line per saved exercise (optionally only those matching
+    `text`), oldest first, via a named server-side cursor.
+    """
+    conditions, params = [], []
+    if text:
+        conditions.append("search_vector @@ websearch_to_tsquery(%s::regconfig, %s)")
+        params.extend([SEARCH_LANGUAGE, text])
+    if safe_only:
+        conditions.append("safety_pass IS NOT FALSE")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with get_pool().connection() as conn:
+        # Named cursors live inside a transaction
+        with conn.transaction():
+            with conn.cursor(name="saved_exercises_export") as cur:
+                cur.itersize = EXPORT_FETCH_SIZE
+                cur.execute(f"""
+                    SELECT id, thread_id, query, content, safety_pass, created_at
+                    FROM saved_exercises {where}
+                    ORDER BY id
+                """, params)
+                for id_, thread_id, query, content, safety_pass, created_at in cur:
+                    yield json.dumps({
+                        'id': id_,
+                        'thread_id': thread_id,
+                        'query': query,
+                        'content': content,
+                        'safety_pass': safety_pass,
+                        'created_at': created_at.isoformat() if created_at else None
+                    }) + "\n"
@@ -1,24 +1,41 @@
+import inspect
 import os
+import threading
 from langgraph.graph import StateGraph
 from langgraph.checkpoint.memory import MemorySaver
 
 from finalizer import finalizer_node
-from state import AgentState
+from state import AgentState, reset_list
+from checkpoint_store import get_checkpointer, get_async_checkpointer
+from history_store import append_history
+import speculative
+import metrics
 from agent.drafter_agent import drafter_agent
 from agent.safety_agent import safety_agent
 from agent.critic_agent import critic_agent
-from agent.supervisor_agent import supervisor_agent
+from agent.supervisor_agent import supervisor_agent, MAX_ITERATIONS
 from langsmith import traceable  # ✅ replaces LangChainTracer
 
 # Optional: Suppress blocking warnings for local run
 os.environ["BG_JOB_ISOLATED_LOOPS"] = "true"
 
-#  LangSmith tracing setup
-os.environ["LANGSMITH_API_KEY"] = os.getenv("LANGSMITH_API_KEY", "")
-os.environ["LANGSMITH_TRACING"] = "true"
+#  LangSmith tracing is opt-in (LANGSMITH_TRACING=true + LANGSMITH_API_KEY);
+#  node timings are always available on /metrics (metrics.py)
 os.environ["LANGSMITH_PROJECT"] = os.getenv("LANGSMITH_PROJECT", "pr-rundown-ant-95")
 
+# Super-steps per invocation: the entry supervisor, MAX_ITERATIONS passes of
+# drafter -> safety+critic -> supervisor, then human approval (plus slack)
+RECURSION_LIMIT = max(25, 3 * MAX_ITERATIONS + 5)
 
+# Process-wide compiled graph (see get_graph)
+_compiled_graph = None
+_graph_lock = threading.Lock()
+_async_graph = None
+
+
+def run_config(thread_id, **configurable):
+    """Invocation config for a thread, with a recursion limit that fits MAX_ITERATIONS."""
+    return {"configurable": {"thread_id": thread_id, **configurable}, "recursion_limit": RECURSION_LIMIT}
 
 
 def build_graph(checkpointer=None):
@@ -31,13 +48,14 @@ def build_graph(checkpointer=None):
     # ----------------------
     # Nodes
     # ----------------------
-    graph.add_node("drafter", drafter_agent)
-    graph.add_node("safety", safety_agent)
-    graph.add_node("critic", critic_agent)
-    graph.add_node("supervisor", supervisor_router)
+    graph.add_node("drafter", timed("drafter", with_history(drafter_agent, {"draft": "draft", "safety_notes": "safety_note"})))
+    graph.add_node("safety", timed("safety", with_history(safety_agent, {"safety_notes": "safety_note"})))
+    graph.add_node("critic", timed("critic", with_history(critic_agent, {"critic_notes": "critic_note"})))
+    graph.add_node("supervisor", timed("supervisor", supervisor_router))
 
-    graph.add_node("human_approval", lambda state: state)
-    graph.add_node("human_approval_done", finalizer_node)
+    # Terminal nodes: every run ends in one of them
+    graph.add_node("human_approval", timed("human_approval", flush_history(human_approval_node)))
+    graph.add_node("human_approval_done", timed("human_approval_done", flush_history(finalizer_node)))
 
     # ----------------------
     # Entry point
@@ -47,16 +65,24 @@ def build_graph(checkpointer=None):
     # ----------------------
     # Edges
     # ----------------------
-    graph.add_edge("drafter", "safety")
-    graph.add_edge("safety", "critic")
-    graph.add_edge("critic", "supervisor")
+    # Fan-out: safety and critic only read the draft, so review in parallel
+    # (a draft already failed by pipelined safety goes straight to supervisor)
+    graph.add_conditional_edges(
+        "drafter",
+        drafter_condition,
+        {"safety": "safety", "critic": "critic", "supervisor": "supervisor"},
+    )
+
+    # Fan-in: supervisor waits for both reviews before routing
+    graph.add_edge(["safety", "critic"], "supervisor")
 
     graph.add_conditional_edges(
         "supervisor",
         supervisor_condition,
         {
             "drafter": "drafter",
-            "safety": "safety",  # needed ONLY for edit cases
+            "safety": "safety",  # edit cases re-review (both reviewers)
+            "critic": "critic",
             "human_approval": "human_approval",
             "human_approval_done": "human_approval_done",
         },
@@ -65,17 +91,123 @@ def build_graph(checkpointer=None):
     return graph.compile(checkpointer=checkpointer)
 
 
+def get_graph():
+    """
+    Return the graph compiled once per process against the pooled Postgres
+    checkpointer. Compiled graphs are stateless between invocations (state
+    lives in the checkpointer, keyed by thread_id), so it is safe to share.
+    """
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = build_graph(get_checkpointer())
+    return _compiled_graph
+
+
+async def aget_graph():
+    """
+    The same graph compiled against the AsyncPostgresSaver, for ainvoke /
+    astream in the ASGI app. Nodes stay synchronous: LangGraph runs them on
+    the event loop's default executor, with the caller's context copied.
+    """
+    global _async_graph
+    if _async_graph is None:
+        _async_graph = build_graph(await get_async_checkpointer())
+    return _async_graph
+
+
 # ------------------------------
 # Helper wrappers
 # ------------------------------
 
-def supervisor_router(state: AgentState):
+def timed(name, node):
+    """
+    Wrapper: record the node's wall time in the cerina_node_seconds
+    histogram. Accepts nodes with or without a config parameter.
+    """
+    takes_config = len(inspect.signature(node).parameters) > 1
+
+    def wrapper(state: AgentState, config):
+        with metrics.NODE_SECONDS.labels(name).time():
+            return node(state, config) if takes_config else node(state)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+def with_history(node, channels):
+    """
+    Wrapper: buffer the new entries a node produces for the session_history
+    side table in pending_history (written once per run, see flush_history).
+    `channels` maps state keys to history kinds; list channels are
+    append-only, so the update holds exactly the new entries.
+    """
+    def wrapper(state: AgentState):
+        updates = node(state)
+        entries = []
+        for key, kind in channels.items():
+            value = updates.get(key)
+            if isinstance(value, list):
+                entries.extend([kind, item] for item in value)
+            elif value:
+                entries.append([kind, value])
+        if entries:
+            updates = {**updates, "pending_history": entries}
+        return updates
+
+    wrapper.__name__ = node.__name__
+    return wrapper
+
+
+def flush_history(node):
+    """
+    Wrapper for terminal nodes: write the run's buffered history entries in
+    a single insert, then clear the buffer. Accepts nodes with or without a
+    config parameter.
+    """
+    takes_config = len(inspect.signature(node).parameters) > 1
+
+    def wrapper(state: AgentState, config):
+        updates = node(state, config) if takes_config else node(state)
+        if state.pending_history:
+            append_history(
+                config.get("configurable", {}).get("thread_id"),
+                [(kind, content) for kind, content in state.pending_history]
+            )
+            updates = {**updates, "pending_history": reset_list()}
+        return updates
+
+    wrapper.__name__ = node.__name__
+    return wrapper
+
+
+def human_approval_node(state: AgentState, config):
+    """
+    Pause point. Must not echo the state back: list channels are
+    append-only, so returning the full state would duplicate entries.
+    Interactive callers (configurable.speculate) get a speculative
+    alternative drafted in the background while the user reviews.
+    """
+    configurable = config.get("configurable", {})
+    if configurable.get("speculate"):
+        speculative.schedule(configurable.get("thread_id"), state)
+    return {}
+
+
+def supervisor_router(state: AgentState, config):
     """
     Wrapper: supervisor_agent updates state + next_node.
     """
     # Run supervisor agent (returns state)
     updated_state = supervisor_agent(state)
 
+    # User edits and served speculative drafts are new drafts too
+    if state.user_action == "edit" and updated_state.get("draft"):
+        updated_state["pending_history"] = [["edited_draft", updated_state["draft"]]]
+    elif state.user_action == "reject" and updated_state.get("draft"):
+        updated_state["pending_history"] = [["draft", updated_state["draft"]]]
+
     # Ensure next_node is present
     if "next_node" not in updated_state["metadata"]:
         updated_state["metadata"]["next_node"] = "human_approval"
@@ -83,8 +215,22 @@ def supervisor_router(state: AgentState):
     return updated_state
 
 
+def drafter_condition(state: AgentState):
+    """
+    Review a new draft with both reviewers in parallel, unless pipelined
+    safety aborted it mid-stream (it already carries its safety note).
+    """
+    if state.metadata.get("draft_aborted"):
+        return "supervisor"
+    return ["safety", "critic"]
+
+
 def supervisor_condition(state: AgentState):
     """
     Graph routing based on supervisor next_node.
+    "review" (and legacy "safety") fans out to both reviewers in parallel.
     """
-    return state.metadata["next_node"]
+    next_node = state.metadata["next_node"]
+    if next_node in ("review", "safety"):
+        return ["safety", "critic"]
+    return next_node
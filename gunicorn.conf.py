@@ -0,0 +1,46 @@
+"""
+Production launch configuration for the ASGI app (asgi.py):
+
+    gunicorn -c gunicorn.conf.py
+
+Settings can be overridden with GUNICORN_CMD_ARGS or the environment
+variables below.
+
+Each instance runs exactly one worker. Live stream runs (stream_runner)
+and speculative drafts (speculative) are registered per process, and
+gunicorn workers share one listening socket, so no balancer can route a
+session to a particular worker: with more than one, GET /stream/<thread_id>
+404s and /action misses the speculation whenever a request lands on
+another worker. One worker holds thousands of idle streams on its own.
+To scale out, run more single-worker instances behind a load balancer
+with sticky routing (cookie or a hash of the client), so every request
+of a session reaches the same instance.
+"""
+
+import os
+
+# - WEB_BIND: address to listen on
+# - WEB_TIMEOUT: seconds a silent worker may take before it is restarted
+# - WEB_GRACEFUL_TIMEOUT: seconds open streams get to finish on reload/shutdown
+# - WEB_KEEPALIVE: seconds to keep idle HTTP connections open
+wsgi_app = "asgi:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = 1  # see above: scale out with instances, not workers
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Pools, executors and the event loop must be created in each worker, not
+# inherited across fork
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's files so /metrics stops counting it
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,160 @@
+"""
+Append-only session history (every draft and review note, in order).
+
+Graph state only keeps a bounded window of recent drafts/notes, so the
+full history is written here once per entry instead of being
+re-serialized into every checkpoint.
+
+list_checkpoints() summarizes a thread's checkpoints straight from the
+checkpointer tables, without deserializing full states.
+"""
+
+from checkpoint_store import get_pool, get_checkpointer
+
+_table_ready = False
+
+
+def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS session_history (
+                thread_id TEXT NOT NULL,
+                ordinal BIGSERIAL,
+                kind TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (thread_id, ordinal)
+            );
+        """)
+    _table_ready = True
+
+
+def append_history(thread_id, entries):
+    """
+    Append (kind, content) entries for a thread, e.g. ("draft", text) or
+    ("safety_note", text). Failures are logged, never raised into the graph.
+    """
+    if not thread_id or not entries:
+        return
+    try:
+        with get_pool().connection() as conn:
+            _ensure_table(conn)
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO session_history (thread_id, kind, content) VALUES (%s, %s, %s)",
+                    [(thread_id, kind, content) for kind, content in entries]
+                )
+    except Exception as e:
+        print(f"Failed to append session history: {e}")
+
+
+def get_history(thread_id, kind=None):
+    """Return [{ordinal, kind, content, created_at}] for a thread, oldest first."""
+    with get_pool().connection() as conn:
+        _ensure_table(conn)
+        with conn.cursor() as cur:
+            if kind:
+                cur.execute(
+                    "SELECT ordinal, kind, content, created_at FROM session_history "
+                    "WHERE thread_id = %s AND kind = %s ORDER BY ordinal",
+                    (thread_id, kind)
+                )
+            else:
+                cur.execute(
+                    "SELECT ordinal, kind, content, created_at FROM session_history "
+                    "WHERE thread_id = %s ORDER BY ordinal",
+                    (thread_id,)
+                )
+            rows = cur.fetchall()
+    return [
+        {'ordinal': o, 'kind': k, 'content': c, 'created_at': t.isoformat() if t else None}
+        for o, k, c, t in rows
+    ]
+
+
+# One row per checkpoint. Scalar channels (draft, user_action, final_output)
+# are stored inline in the checkpoint JSON, so length/hash are computed in SQL;
+# nodes that ran are the versions_seen entries that changed since the parent.
+_CHECKPOINT_SUMMARY_SQL = """
+    SELECT c.checkpoint_id,
+           c.parent_checkpoint_id,
+           c.checkpoint->>'ts',
+           c.metadata->>'source',
+           c.metadata->>'step',
+           ARRAY(
+               SELECT v.key FROM jsonb_each(c.checkpoint->'versions_seen') v
+               WHERE left(v.key, 2) <> '__'
+                 AND v.value IS DISTINCT FROM p.checkpoint->'versions_seen'->v.key
+               ORDER BY v.key
+           ),
+           char_length(c.checkpoint->'channel_values'->>'draft'),
+           left(encode(sha256(convert_to(c.checkpoint->'channel_values'->>'draft', 'UTF8')), 'hex'), 16),
+           c.checkpoint->'channel_values'->>'user_action',
+           coalesce(c.checkpoint->'channel_values'->>'final_output', '') <> '',
+           c.checkpoint->'channel_versions'->>'metadata'
+    FROM checkpoints c
+    LEFT JOIN checkpoints p
+           ON p.thread_id = c.thread_id AND p.checkpoint_ns = c.checkpoint_ns
+          AND p.checkpoint_id = c.parent_checkpoint_id
+    WHERE c.thread_id = %s AND c.checkpoint_ns = ''
+      AND (%s::text IS NULL OR c.checkpoint_id < %s)
+    ORDER BY c.checkpoint_id DESC
+    LIMIT %s
+"""
+
+
+def list_checkpoints(thread_id, limit=20, before=None):
+    """
+    Compact per-step summaries for a thread, newest first: checkpoint id,
+    timestamp, step, nodes that ran, draft length and hash, and verdicts.
+    Pass the last checkpoint_id as `before` for the next page.
+    """
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_CHECKPOINT_SUMMARY_SQL, (thread_id, before, before, limit))
+            rows = cur.fetchall()
+
+            # The metadata channel (verdicts) is a blob shared by every
+            # checkpoint with the same version: load each version once
+            versions = list({row[10] for row in rows if row[10]})
+            blobs = {}
+            if versions:
+                cur.execute(
+                    "SELECT version, type, blob FROM checkpoint_blobs "
+                    "WHERE thread_id = %s AND checkpoint_ns = '' AND channel = 'metadata' AND version = ANY(%s)",
+                    (thread_id, versions)
+                )
+                blobs = {version: (type_, blob) for version, type_, blob in cur.fetchall()}
+
+    serde = get_checkpointer().serde
+    metadata_by_version = {}
+    for version, (type_, blob) in blobs.items():
+        try:
+            metadata_by_version[version] = serde.loads_typed((type_, bytes(blob))) if type_ != "empty" else {}
+        except Exception as e:
+            print(f"Failed to decode metadata for {thread_id} @ {version}: {e}")
+
+    summaries = []
+    for (checkpoint_id, parent_id, ts, source, step, nodes, draft_chars, digest,
+         user_action, approved, metadata_version) in rows:
+        metadata = metadata_by_version.get(metadata_version) or {}
+        summaries.append({
+            'checkpoint_id': checkpoint_id,
+            'parent_checkpoint_id': parent_id,
+            'timestamp': ts,
+            'step': int(step) if step is not None else None,
+            'source': source,
+            'nodes': list(nodes),
+            'draft_chars': draft_chars or 0,
+            'draft_hash': digest,
+            'user_action': user_action or '',
+            'approved': approved,
+            'iterations': metadata.get('iterations', 0),
+            'safety_pass': metadata.get('safety_pass'),
+            'critic_pass': metadata.get('critic_pass'),
+            'next_node': metadata.get('next_node', '')
+        })
+    return summaries
@@ -0,0 +1,185 @@
+"""
+Asynchronous generation jobs.
+
+POST /generate with {"async": true} submits the graph run here and returns
+a job id immediately. Jobs run on a bounded worker pool; their status and
+result live in the generation_jobs table so any process can serve
+GET /jobs/<job_id>. An optional callback URL receives the final job
+document as a JSON POST.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from checkpoint_store import get_pool
+
+# - JOB_MAX_IN_FLIGHT: graph runs executing at once
+# - JOB_MAX_QUEUE: accepted jobs waiting for a worker; beyond this, submit is refused
+# - JOB_CALLBACK_TIMEOUT / JOB_CALLBACK_RETRIES: webhook delivery
+# - JOB_CALLBACK_WORKERS: threads delivering webhooks (separate from job workers)
+JOB_MAX_IN_FLIGHT = int(os.getenv("JOB_MAX_IN_FLIGHT", "4"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "32"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+JOB_CALLBACK_WORKERS = int(os.getenv("JOB_CALLBACK_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_MAX_IN_FLIGHT, thread_name_prefix="cerina-job")
+# Webhook retries sleep; they must not occupy job workers
+_callback_executor = ThreadPoolExecutor(max_workers=JOB_CALLBACK_WORKERS, thread_name_prefix="cerina-job-callback")
+# Jobs accepted and not yet finished (running + queued), bounded by submit_job
+_occupied = 0
+_occupied_lock = threading.Lock()
+_table_ready = False
+
+
+class QueueFull(Exception):
+    """Raised by submit_job when in-flight + queued jobs are at capacity."""
+
+
+def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                job_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result JSONB,
+                error TEXT,
+                callback_url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    _table_ready = True
+
+
+def _set_status(job_id, status, result=None, error=None):
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE generation_jobs SET status = %s, result = %s, error = %s, updated_at = CURRENT_TIMESTAMP "
+                "WHERE job_id = %s",
+                (status, json.dumps(result) if result is not None else None, error, job_id)
+            )
+
+
+def submit_job(thread_id, run, callback_url=None, conn=None):
+    """
+    Queue `run` (a no-arg callable returning a JSON-serializable dict) and
+    return the new job id. Raises QueueFull when at capacity. Pass `conn`
+    to insert the job row on a connection the caller already holds.
+    """
+    global _occupied
+    with _occupied_lock:
+        if _occupied >= JOB_MAX_IN_FLIGHT + JOB_MAX_QUEUE:
+            raise QueueFull(f"{JOB_MAX_IN_FLIGHT} jobs running and {JOB_MAX_QUEUE} queued")
+        _occupied += 1
+
+    try:
+        job_id = uuid.uuid4().hex
+        with (nullcontext(conn) if conn is not None else get_pool().connection()) as conn:
+            _ensure_table(conn)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO generation_jobs (job_id, thread_id, status, callback_url) VALUES (%s, %s, 'queued', %s)",
+                    (job_id, thread_id, callback_url)
+                )
+        _executor.submit(_run_job, job_id, run, callback_url)
+    except Exception:
+        _release_slot()
+        raise
+    return job_id
+
+
+def _release_slot():
+    global _occupied
+    with _occupied_lock:
+        _occupied -= 1
+
+
+def _run_job(job_id, run, callback_url):
+    try:
+        _set_status(job_id, 'running')
+        result = run()
+        _set_status(job_id, 'succeeded', result=result)
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        traceback.print_exc()
+        try:
+            _set_status(job_id, 'failed', error=str(e))
+        except Exception as db_error:
+            print(f"Failed to record job {job_id} failure: {db_error}")
+    finally:
+        _release_slot()
+
+    if callback_url:
+        _callback_executor.submit(_deliver_callback, job_id, callback_url)
+
+
+def _deliver_callback(job_id, callback_url):
+    """POST the job document to callback_url, retrying with backoff."""
+    try:
+        body = json.dumps(get_job(job_id)).encode()
+    except Exception as e:
+        print(f"Job {job_id} callback skipped: {e}")
+        return
+
+    for attempt in range(JOB_CALLBACK_RETRIES):
+        try:
+            req = urllib.request.Request(
+                callback_url, data=body, method='POST',
+                headers={'Content-Type': 'application/json'}
+            )
+            with urllib.request.urlopen(req, timeout=JOB_CALLBACK_TIMEOUT) as resp:
+                if resp.status < 300:
+                    return
+        except Exception as e:
+            print(f"Job {job_id} callback attempt {attempt + 1} failed: {e}")
+        if attempt + 1 < JOB_CALLBACK_RETRIES:
+            time.sleep(2 ** attempt)
+
+
+def get_job(job_id):
+    """Return the job document, or None if unknown."""
+    with get_pool().connection() as conn:
+        _ensure_table(conn)
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT job_id, thread_id, status, result, error, created_at, updated_at "
+                "FROM generation_jobs WHERE job_id = %s",
+                (job_id,)
+            )
+            row = cur.fetchone()
+    if row is None:
+        return None
+    job_id, thread_id, status, result, error, created_at, updated_at = row
+    return {
+        'job_id': job_id,
+        'thread_id': thread_id,
+        'status': status,
+        'result': result,
+        'error': error,
+        'created_at': created_at.isoformat() if created_at else None,
+        'updated_at': updated_at.isoformat() if updated_at else None
+    }
+
+
+def get_stats():
+    """Capacity snapshot for /health."""
+    with _occupied_lock:
+        occupied = _occupied
+    return {
+        'max_in_flight': JOB_MAX_IN_FLIGHT,
+        'max_queue': JOB_MAX_QUEUE,
+        'occupied': occupied
+    }
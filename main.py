@@ -8,17 +8,36 @@ Flask web application integrating LangGraph multi-agent workflow with:
 """
 
 from flask import Flask, render_template, request, jsonify, Response, stream_with_context
-from graph_builder import build_graph
-from state import AgentState
-from checkpoint_store import get_checkpointer_context, get_pool
+from graph_builder import get_graph, run_config
+from state import AgentState, initial_state
+from checkpoint_store import get_pool, get_pool_stats
+from agent.verdict_cache import get_stats as get_verdict_cache_stats
+from session_store import save_session_metadata, save_exercise
+from history_store import list_checkpoints
+from retention import delete_sessions, start_sweeper, get_stats as get_retention_stats
+from exercise_search import search_exercises, export_exercises, ensure_schema as ensure_search_schema
+from stream_runner import start_run, get_run, parse_event_id, sse_frames
+import speculative
+import metrics
+from batch import run_batch, read_items, BATCH_CONCURRENCY, BATCH_RETRIES
+from jobs import submit_job, get_job, QueueFull, get_stats as get_job_stats
 import traceback
 import json
+import base64
+import hashlib
 from datetime import datetime
 
 app = Flask(__name__)
 
-# Note: We do NOT build a global graph anymore because checkpointers 
-# need to be scoped per-request for thread safety with Postgres.
+# Upper bound on thread_ids per POST /sessions/delete (one transaction)
+MAX_BULK_DELETE = 1000
+
+# Deep OFFSET pages scan every skipped row; past this, narrow the query instead
+MAX_SEARCH_OFFSET = 1000
+
+# Note: The graph is compiled once per process (graph_builder.get_graph) against
+# a pool-bound PostgresSaver, so each checkpoint operation checks out its own
+# connection and the compiled graph can be shared safely across requests.
 
 @app.route('/')
 def index():
@@ -26,25 +45,74 @@ def index():
     return render_template('index.html')
 
 
+SESSIONS_PAGE_SIZE = 50
+SESSIONS_MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(created_at, thread_id):
+    raw = json.dumps([created_at.isoformat() if created_at else None, thread_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    created_at, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return (datetime.fromisoformat(created_at) if created_at else None), thread_id
+
+
 @app.route('/sessions', methods=['GET'])
 def get_sessions():
     """
-    Get all session history from session_metadata table
+    Get a page of session history from session_metadata, newest first.
+    Query params:
+    - limit: page size (default 50, max 200)
+    - cursor: next_cursor from the previous page (keyset on created_at, thread_id)
+    - q: optional case-insensitive title prefix
+    Responses carry an ETag; a matching If-None-Match returns 304.
     """
+    try:
+        limit = min(max(int(request.args.get('limit', SESSIONS_PAGE_SIZE)), 1), SESSIONS_MAX_PAGE_SIZE)
+        conditions, params = [], []
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, thread_id = _decode_cursor(cursor)
+            if created_at is None:
+                # NULL created_at rows sort first (DESC); continue through them, then the rest
+                conditions.append("((created_at IS NULL AND thread_id < %s) OR created_at IS NOT NULL)")
+                params.append(thread_id)
+            else:
+                conditions.append("(created_at, thread_id) < (%s, %s)")
+                params.extend([created_at, thread_id])
+        prefix = request.args.get('q', '').strip().lower()
+        if prefix:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("lower(title) LIKE %s")
+            params.append(escaped + '%')
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f"Invalid pagination parameters: {e}"}), 400
+
     try:
         pool = get_pool()
         sessions = []
+        next_cursor = None
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         
         with pool.connection() as conn:
             with conn.cursor() as cur:
                 # Get sessions from our dedicated metadata table
-                cur.execute("""
+                # (served by session_metadata_created_idx / _title_prefix_idx)
+                cur.execute(f"""
                     SELECT thread_id, title, created_at
                     FROM session_metadata 
-                    ORDER BY created_at DESC
-                """)
+                    {where}
+                    ORDER BY created_at DESC, thread_id DESC
+                    LIMIT %s
+                """, (*params, limit + 1))
                 rows = cur.fetchall()
                 
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = _encode_cursor(rows[-1][2], rows[-1][0])
+                
                 for row in rows:
                     thread_id, title, created_at = row
                     sessions.append({
@@ -53,16 +121,70 @@ def get_sessions():
                         'query': title or f"Session {thread_id[-8:]}" 
                     })
 
-        return jsonify({'sessions': sessions})
+        response = jsonify({'sessions': sessions, 'next_cursor': next_cursor})
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         print(f"Error in /sessions: {type(e).__name__}: {str(e)}")
         traceback.print_exc()
-        return jsonify({'sessions': []})
+        return jsonify({'sessions': [], 'next_cursor': None})
+
+def _build_response(result, thread_id):
+    """Extract the API response payload from a final graph state."""
+    return {
+        'draft': result.get('draft', ''),
+        'iterations': result.get('metadata', {}).get('iterations', 0),
+        'safety_pass': result.get('metadata', {}).get('safety_pass', True),
+        'critic_pass': result.get('metadata', {}).get('critic_pass', True),
+        'safety_notes': result.get('safety_notes', []),
+        'critic_notes': result.get('critic_notes', []),
+        'final_output': result.get('final_output', ''),
+        'next_node': result.get('metadata', {}).get('next_node', ''),
+        'thread_id': thread_id
+    }
+
+
+def _build_action_response(result, action):
+    """Extract the /action response payload from the state after an action."""
+    approved = action == 'approve' and result.get('final_output', '') != ''
+    return {
+        'draft': result.get('draft', ''),
+        'iterations': result.get('metadata', {}).get('iterations', 0),
+        'safety_pass': result.get('metadata', {}).get('safety_pass', True),
+        'critic_pass': result.get('metadata', {}).get('critic_pass', True),
+        'safety_notes': result.get('safety_notes', []),
+        'critic_notes': result.get('critic_notes', []),
+        'final_output': result.get('final_output', ''),
+        'next_node': result.get('metadata', {}).get('next_node', ''),
+        'approved': approved
+    }
+
+
+def _run_generation(user_query, thread_id):
+    config = run_config(thread_id)
+    # Shared compiled graph with pool-bound checkpointer
+    result = get_graph().invoke(initial_state(user_query), config=config)
+    return _build_response(result, thread_id)
+
+
+def _queue_generation(user_query, thread_id, callback_url):
+    """
+    Save session metadata and queue the run as a job on one pool checkout.
+    Returns the job id; raises QueueFull.
+    """
+    with get_pool().connection() as conn:
+        save_session_metadata(thread_id, user_query, conn=conn)
+        return submit_job(thread_id, lambda: _run_generation(user_query, thread_id), callback_url, conn=conn)
+
 
 @app.route('/generate', methods=['POST'])
 def generate():
     """
     Generate a new CBT exercise from user query (Synchronous Fallback)
+    With {"async": true} the run is queued as a job instead: responds 202
+    with a job_id to poll at /jobs/<job_id> (optional "callback_url" is
+    POSTed the job document when it finishes), or 429 when the queue is full.
     """
     try:
         data = request.get_json()
@@ -72,59 +194,72 @@ def generate():
         if not user_query:
             return jsonify({'error': 'No query provided'}), 400
 
-        # Save session metadata
-        try:
-            pool = get_pool()
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "INSERT INTO session_metadata (thread_id, title) VALUES (%s, %s) ON CONFLICT (thread_id) DO NOTHING",
-                        (thread_id, user_query[:100])
-                    )
-        except Exception as e:
-            print(f"Failed to save session metadata: {e}")
-        
-        # Initial state
-        initial_state = {
-            "user_query": user_query,
-            "draft": "",
-            "previous_drafts": [],
-            "safety_notes": [],
-            "critic_notes": [],
-            "metadata": {
-                "iterations": 0, "safety_pass": True, "critic_pass": True,
-                "user_rejected": False, "edited_by_user": False
-            },
-            "final_output": "", "user_action": "", "edited_text": ""
-        }
-        
-        config = {"configurable": {"thread_id": thread_id}}
-        
-        # Use thread-safe checkpointer
-        with get_checkpointer_context() as checkpointer:
-            graph = build_graph(checkpointer)
-            result = graph.invoke(initial_state, config=config)
+        callback_url = data.get('callback_url')
+        if callback_url and not callback_url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'callback_url must be an http(s) URL'}), 400
+
+        if data.get('async'):
+            try:
+                job_id = _queue_generation(user_query, thread_id, callback_url)
+            except QueueFull as e:
+                response = jsonify({'error': f"Job queue is full: {e}"})
+                response.headers['Retry-After'] = '5'
+                return response, 429
+            return jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/jobs/{job_id}",
+                'thread_id': thread_id
+            }), 202
         
-        # Extract response
-        response_data = {
-            'draft': result.get('draft', ''),
-            'iterations': result.get('metadata', {}).get('iterations', 0),
-            'safety_pass': result.get('metadata', {}).get('safety_pass', True),
-            'critic_pass': result.get('metadata', {}).get('critic_pass', True),
-            'safety_notes': result.get('safety_notes', []),
-            'critic_notes': result.get('critic_notes', []),
-            'final_output': result.get('final_output', ''),
-            'next_node': result.get('metadata', {}).get('next_node', ''),
-            'thread_id': thread_id
-        }
+        # Save session metadata
+        save_session_metadata(thread_id, user_query)
         
-        return jsonify(response_data)
+        return jsonify(_run_generation(user_query, thread_id))
         
     except Exception as e:
         print(f"Error in /generate: {str(e)}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Poll an async generation job: status is queued, running, succeeded or
+    failed; result holds the /generate payload once succeeded.
+    """
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        print(f"Error in /jobs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/batch', methods=['POST'])
+def batch_generate():
+    """
+    Bulk generation. Body is JSONL (one {"topic", "instructions", "id"} per
+    line); results stream back as JSONL in completion order.
+    Query params: concurrency, retries, auto_approve=true.
+    Re-posting the same file resumes unfinished items (see batch.py).
+    """
+    try:
+        concurrency = int(request.args.get('concurrency', BATCH_CONCURRENCY))
+        retries = int(request.args.get('retries', BATCH_RETRIES))
+    except ValueError as e:
+        return jsonify({'error': f"Invalid batch parameters: {e}"}), 400
+    auto_approve = request.args.get('auto_approve', '').lower() == 'true'
+    lines = request.get_data(as_text=True).splitlines()
+
+    def generate_results():
+        for result in run_batch(read_items(lines), concurrency, auto_approve, retries):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate_results()), mimetype='application/x-ndjson')
+
 @app.route('/stream', methods=['POST'])
 def stream_generate():
     """
@@ -136,97 +271,44 @@ def stream_generate():
         thread_id = data.get('thread_id', 'default-thread')
         
         # Save session metadata for stream requests too
-        try:
-            pool = get_pool()
-            with pool.connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "INSERT INTO session_metadata (thread_id, title) VALUES (%s, %s) ON CONFLICT (thread_id) DO NOTHING",
-                        (thread_id, user_query[:100])
-                    )
-        except Exception as ex:
-             print(f"Failed to save session metadata (stream): {ex}")
+        save_session_metadata(thread_id, user_query)
 
     except Exception as e:
         return jsonify({'error': f"Invalid request: {str(e)}"}), 400
 
-    def generate_stream(query, tid):
-        import queue
-        import threading
-        from agent.stream_utils import set_stream_callback
-        
-        if not query:
-            yield f"data: {json.dumps({'error': 'No query provided'})}\n\n"
-            return
-        
-        print(f"Starting stream for thread {tid}")
-        
-        event_queue = queue.Queue()
-        
-        initial_state = {
-            "user_query": query,
-            "draft": "",
-            "previous_drafts": [],
-            "safety_notes": [],
-            "critic_notes": [],
-            "metadata": {
-                "iterations": 0, "safety_pass": True, "critic_pass": True,
-                "user_rejected": False, "edited_by_user": False
-            },
-            "final_output": "", "user_action": "", "edited_text": ""
-        }
-        
-        config = {"configurable": {"thread_id": tid}} 
-        
-        # Define callbacks
-        def token_callback(token):
-            event_queue.put({'type': 'token', 'token': token})
-            
-        def run_graph():
-            # Set the thread-local callback
-            token = set_stream_callback(token_callback)
-            try:
-                with get_checkpointer_context() as checkpointer:
-                    graph = build_graph(checkpointer)
-                    
-                    print("Invoking graph stream...")
-                    for event in graph.stream(initial_state, config=config):
-                        event_queue.put({
-                            'type': 'node_complete',
-                            'data': event,
-                            'timestamp': datetime.now().isoformat()
-                        })
-                event_queue.put({'type': 'complete'})
-            except Exception as e:
-                print(f"Stream thread error: {e}")
-                traceback.print_exc()
-                event_queue.put({'type': 'error', 'error': str(e)})
-        
-        # Start background thread
-        thread = threading.Thread(target=run_graph)
-        thread.start()
-        
-        # Yield from queue
-        while True:
-            try:
-                # Wait for next event
-                event = event_queue.get(timeout=600)  # Long timeout for LLM generation
-                
-                if event['type'] == 'complete':
-                    yield f"data: {json.dumps(event)}\n\n"
-                    break
-                elif event['type'] == 'error':
-                    yield f"data: {json.dumps(event)}\n\n"
-                    break
-                else:
-                    yield f"data: {json.dumps(event)}\n\n"
-                    
-            except queue.Empty:
-                # Timeout
-                yield f"data: {json.dumps({'type': 'error', 'error': 'Stream timed out'})}\n\n"
-                break
-    
-    return Response(stream_with_context(generate_stream(user_query, thread_id)), mimetype='text/event-stream')
+    if not user_query:
+        return Response(f"data: {json.dumps({'error': 'No query provided'})}\n\n", mimetype='text/event-stream')
+
+    # Graph runs on the shared stream executor; refuse rather than queue unboundedly
+    run = start_run(thread_id, initial_state(user_query))
+    if run is None:
+        response = jsonify({'error': 'Too many concurrent streams, retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    return Response(
+        stream_with_context(sse_frames(run)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/stream/<thread_id>', methods=['GET'])
+def resume_stream(thread_id):
+    """
+    Reattach to a thread's running (or recently finished) stream.
+    Replays events after the Last-Event-ID header (or ?last_event_id=),
+    then follows live output.
+    """
+    run = get_run(thread_id)
+    if run is None:
+        return jsonify({'error': 'No active stream for this thread'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        stream_with_context(sse_frames(run, parse_event_id(run, last_event_id))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/action', methods=['POST'])
 def handle_action():
@@ -242,51 +324,31 @@ def handle_action():
         if not action:
             return jsonify({'error': 'No action specified'}), 400
         
-        config = {"configurable": {"thread_id": thread_id}}
+        config = run_config(thread_id, speculate=True)
         
-        with get_checkpointer_context() as checkpointer:
-            graph = build_graph(checkpointer)
-            
-            # Get the last state
-            state_snapshot = graph.get_state(config)
-            current_state = state_snapshot.values
-            
-            # Update state
-            updated_state = dict(current_state)
-            updated_state['user_action'] = action
-            if action == 'edit':
-                updated_state['edited_text'] = edited_text
-            
-            # Continue execution
-            result = graph.invoke(updated_state, config=config)
+        # No speculative write may land while this action runs; on reject,
+        # give one that is nearly done a moment to finish so it can be served
+        speculative.cancel(thread_id, wait=speculative.SPECULATIVE_REJECT_WAIT if action == 'reject' else 0)
+        
+        graph = get_graph()
+        
+        # Only send the changed keys: the rest is restored from the checkpoint
+        # (re-sending list channels would append duplicates to them)
+        update = {'user_action': action}
+        if action == 'edit':
+            update['edited_text'] = edited_text
+        
+        # Continue execution
+        result = graph.invoke(update, config=config)
         
         result_dict = result if isinstance(result, dict) else result.dict()
         
         if action == 'approve' and result_dict.get('final_output', '') != '':
             # Save to dedicated results table
-            try:
-                pool = get_pool()
-                with pool.connection() as conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO saved_exercises (thread_id, query, content) VALUES (%s, %s, %s)",
-                            (thread_id, result_dict.get('user_query', ''), result_dict.get('final_output'))
-                        )
-            except Exception as e:
-                print(f"Failed to save exercise: {e}")
+            save_exercise(thread_id, result_dict)
 
         
-        response_data = {
-            'draft': result_dict.get('draft', ''),
-            'iterations': result_dict.get('metadata', {}).get('iterations', 0),
-            'safety_pass': result_dict.get('metadata', {}).get('safety_pass', True),
-            'critic_pass': result_dict.get('metadata', {}).get('critic_pass', True),
-            'safety_notes': result_dict.get('safety_notes', []),
-            'critic_notes': result_dict.get('critic_notes', []),
-            'final_output': result_dict.get('final_output', ''),
-            'next_node': result_dict.get('metadata', {}).get('next_node', ''),
-            'approved': action == 'approve' and result_dict.get('final_output', '') != ''
-        }
+        response_data = _build_action_response(result_dict, action)
         
         return jsonify(response_data)
         
@@ -299,77 +361,195 @@ def handle_action():
 @app.route('/history/<thread_id>', methods=['GET'])
 def get_thread_history(thread_id):
     """
-    Get the full history of a specific thread/session
+    List a thread's checkpoints, newest first, as compact step summaries
+    (node, timestamp, draft length/hash, verdicts) without draft text.
+    Query params: limit (default 20, max 100), before (checkpoint_id from
+    next_before). Full state per step: /history/<thread_id>/<checkpoint_id>.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    before = request.args.get('before') or None
+
+    try:
+        history = list_checkpoints(thread_id, limit=limit, before=before)
+        return jsonify({
+            'thread_id': thread_id,
+            'history': history,
+            'next_before': history[-1]['checkpoint_id'] if len(history) == limit else None
+        })
+        
+    except Exception as e:
+        print(f"Error in /history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/history/<thread_id>/<checkpoint_id>', methods=['GET'])
+def get_thread_checkpoint(thread_id, checkpoint_id):
+    """
+    Full state of one checkpoint ("latest" for the current state).
     """
     try:
         config = {"configurable": {"thread_id": thread_id}}
+        if checkpoint_id != 'latest':
+            config["configurable"]["checkpoint_id"] = checkpoint_id
         
-        with get_checkpointer_context() as checkpointer:
-            graph = build_graph(checkpointer)
-            state_snapshot = graph.get_state(config)
-            
-            history = []
-            if state_snapshot.values:
-                history.append({
-                    'state': state_snapshot.values,
-                    'timestamp': datetime.now().isoformat()
-                })
+        snapshot = get_graph().get_state(config)
+        if not snapshot.values:
+            return jsonify({'error': 'Checkpoint not found'}), 404
         
         return jsonify({
             'thread_id': thread_id,
-            'history': history
+            'checkpoint_id': snapshot.config["configurable"].get("checkpoint_id"),
+            'parent_checkpoint_id': (snapshot.parent_config or {}).get("configurable", {}).get("checkpoint_id"),
+            'created_at': snapshot.created_at,
+            'next': list(snapshot.next),
+            'state': snapshot.values
         })
         
     except Exception as e:
         print(f"Error in /history: {str(e)}")
         return jsonify({'error': str(e)}), 500
+
 @app.route('/sessions/<thread_id>', methods=['DELETE'])
 def delete_session(thread_id):
+    """Delete everything stored for one session, in a single transaction."""
     try:
-        pool = get_pool()
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
-                # Cleanup all tables
-                tables = ['checkpoints', 'checkpoint_blobs', 'checkpoint_writes', 'saved_exercises', 'session_metadata']
-                for table in tables:
-                    try:
-                        cur.execute(f"DELETE FROM {table} WHERE thread_id = %s", (thread_id,))
-                    except Exception:
-                        conn.rollback()
-                        continue
-        return jsonify({'status': 'deleted', 'id': thread_id})
+        speculative.cancel(thread_id)
+        deleted = delete_sessions([thread_id])
+        return jsonify({'status': 'deleted', 'id': thread_id, 'rows': deleted})
     except Exception as e:
         print(f"Error deleting session {thread_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/sessions/delete', methods=['POST'])
+def delete_sessions_bulk():
+    """
+    Bulk delete: {"thread_ids": [...], "keep_exercises": false}.
+    All sessions are removed in one transaction, or none are.
+    """
+    data = request.get_json(silent=True) or {}
+    thread_ids = data.get('thread_ids')
+    if not isinstance(thread_ids, list) or not thread_ids or not all(isinstance(t, str) for t in thread_ids):
+        return jsonify({'error': 'thread_ids must be a non-empty list of strings'}), 400
+    if len(thread_ids) > MAX_BULK_DELETE:
+        return jsonify({'error': f"At most {MAX_BULK_DELETE} thread_ids per request"}), 400
+    try:
+        for thread_id in thread_ids:
+            speculative.cancel(thread_id)
+        deleted = delete_sessions(thread_ids, keep_exercises=bool(data.get('keep_exercises')))
+        return jsonify({'status': 'deleted', 'ids': thread_ids, 'rows': deleted})
+    except Exception as e:
+        print(f"Error bulk deleting sessions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/exercises/search', methods=['GET'])
+def search_saved_exercises():
+    """
+    Full-text search over saved exercises.
+    Query params: q (websearch syntax), limit (default 20, max 100),
+    offset (from next_offset), safe_only (default true).
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    if offset > MAX_SEARCH_OFFSET:
+        return jsonify({'error': f"offset must be at most {MAX_SEARCH_OFFSET}; refine the query"}), 400
+    safe_only = request.args.get('safe_only', 'true').lower() != 'false'
+
+    try:
+        results = search_exercises(q, limit=limit, offset=offset, safe_only=safe_only)
+        return jsonify({
+            'query': q,
+            'results': results,
+            'next_offset': offset + limit if len(results) == limit else None
+        })
+    except Exception as e:
+        print(f"Error in /exercises/search: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/exercises/export', methods=['GET'])
+def export_saved_exercises():
+    """
+    Stream saved exercises as NDJSON (optionally filtered by q),
+    read through a server-side cursor.
+    """
+    q = (request.args.get('q') or '').strip() or None
+    safe_only = request.args.get('safe_only', 'true').lower() != 'false'
+    return Response(
+        stream_with_context(export_exercises(q, safe_only=safe_only)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="saved_exercises.ndjson"'}
+    )
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'service': 'Cerina CBT Generator'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'Cerina CBT Generator',
+        'verdict_cache': get_verdict_cache_stats(),
+        'jobs': get_job_stats(),
+        'retention': get_retention_stats(),
+        'pool': get_pool_stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (node, LLM, checkpoint and pool histograms)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+def init_db():
+    """Create the app's own tables and indexes (checkpoint tables are set up by get_pool)."""
+    pool = get_pool()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            # Ensure saved_exercises exists
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS saved_exercises (
+                    id SERIAL PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    query TEXT,
+                    content TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            # Semantic cache only serves exercises that passed safety
+            cur.execute("ALTER TABLE saved_exercises ADD COLUMN IF NOT EXISTS safety_pass BOOLEAN")
+            # Create session_metadata table
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS session_metadata (
+                    thread_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            # Keyset pagination + title prefix search for /sessions
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS session_metadata_created_idx
+                ON session_metadata (created_at DESC, thread_id DESC);
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS session_metadata_title_prefix_idx
+                ON session_metadata (lower(title) text_pattern_ops);
+            """)
+    # Search column + indexes over saved_exercises
+    ensure_search_schema()
+
 
 if __name__ == '__main__':
     try:
-        pool = get_pool()
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
-                # Ensure saved_exercises exists
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS saved_exercises (
-                        id SERIAL PRIMARY KEY,
-                        thread_id TEXT NOT NULL,
-                        query TEXT,
-                        content TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                # Create session_metadata table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS session_metadata (
-                        thread_id TEXT PRIMARY KEY,
-                        title TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
+        init_db()
         print("✅ DB Connection Pool Initialized & Tables Verified")
+        # Compile the graph once up front so the first request doesn't pay for it
+        get_graph()
+        # Expire abandoned sessions in the background (RETENTION_DAYS)
+        start_sweeper()
     except Exception as e:
         print(f"⚠️ DB Setup Failed: {e}")
 
@@ -0,0 +1,148 @@
+"""
+Prometheus instrumentation, served at GET /metrics.
+
+- cerina_node_seconds: wall time per graph node
+- cerina_llm_*: time to first token, duration, tokens/sec, token counts
+  and estimated cost per completion
+- cerina_checkpoint_*: checkpointer read/write latency and blob sizes
+- cerina_pool_*: time spent waiting for a pool connection, plus the
+  pool's own counters (size, available, waiting) at scrape time
+
+Works without LangSmith. Under a multi-process server set
+PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all workers.
+"""
+
+import os
+import threading
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# USD per 1M (prompt, completion) tokens, used for the cost estimate.
+# LLM_PRICE_INPUT_PER_1M / LLM_PRICE_OUTPUT_PER_1M override it for every model.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "fake": (0.0, 0.0),
+}
+_PRICE_OVERRIDE = (os.getenv("LLM_PRICE_INPUT_PER_1M"), os.getenv("LLM_PRICE_OUTPUT_PER_1M"))
+
+_FAST = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_SLOW = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+_TOKENS = (1, 10, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+NODE_SECONDS = Histogram(
+    "cerina_node_seconds", "Wall time of one graph node execution", ["node"], buckets=_SLOW)
+
+LLM_TTFT_SECONDS = Histogram(
+    "cerina_llm_ttft_seconds", "Time to first streamed token", ["model"], buckets=_FAST + (20, 30))
+LLM_SECONDS = Histogram(
+    "cerina_llm_seconds", "Wall time of one completion", ["model"], buckets=_SLOW)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "cerina_llm_tokens_per_second", "Completion tokens per second of generation", ["model"],
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 400))
+LLM_TOKENS = Histogram(
+    "cerina_llm_tokens", "Tokens per completion", ["model", "kind"], buckets=_TOKENS)
+LLM_COST_USD = Histogram(
+    "cerina_llm_cost_usd", "Estimated cost of one completion (USD)", ["model"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+
+CHECKPOINT_SECONDS = Histogram(
+    "cerina_checkpoint_seconds", "Checkpointer call latency", ["op"], buckets=_FAST)
+CHECKPOINT_BYTES = Histogram(
+    "cerina_checkpoint_bytes", "Serialized bytes written per checkpointer call", ["op"], buckets=_BYTES)
+
+POOL_WAIT_SECONDS = Histogram(
+    "cerina_pool_wait_seconds", "Time spent waiting for a pool connection", buckets=_FAST + (20, 30))
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    if _PRICE_OVERRIDE[0] is not None:
+        input_price = float(_PRICE_OVERRIDE[0])
+    if _PRICE_OVERRIDE[1] is not None:
+        output_price = float(_PRICE_OVERRIDE[1])
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def observe_llm(model, duration, prompt_tokens, completion_tokens, ttft=None):
+    """Record one completion. `ttft` is only known for streamed calls."""
+    LLM_SECONDS.labels(model).observe(duration)
+    LLM_TOKENS.labels(model, "prompt").observe(prompt_tokens)
+    LLM_TOKENS.labels(model, "completion").observe(completion_tokens)
+    LLM_COST_USD.labels(model).observe(estimate_cost(model, prompt_tokens, completion_tokens))
+    if ttft is not None:
+        LLM_TTFT_SECONDS.labels(model).observe(ttft)
+    generating = duration - (ttft or 0)
+    if completion_tokens and generating > 0:
+        LLM_TOKENS_PER_SECOND.labels(model).observe(completion_tokens / generating)
+
+
+def serialized_size(rows):
+    """Total bytes of the serialized values in checkpointer rows (tuples)."""
+    return sum(
+        len(value) for row in rows for value in row
+        if isinstance(value, (bytes, bytearray, memoryview))
+    )
+
+
+class _PoolCollector:
+    """Reads each registered pool's get_stats() at scrape time (label: pool)."""
+
+    GAUGES = {
+        "pool_min": "Configured minimum pool size",
+        "pool_size": "Connections currently managed by the pool",
+        "pool_available": "Idle connections ready to be handed out",
+        "pool_max": "Configured maximum pool size",
+        "requests_waiting": "Requests queued waiting for a connection",
+        "requests_num": "Connection requests served since start",
+        "requests_queued": "Requests that had to wait for a connection since start",
+        "requests_wait_ms": "Total time requests spent waiting since start (ms)",
+        "requests_errors": "Connection requests that failed (e.g. timed out) since start",
+        "usage_ms": "Total time connections were checked out since start (ms)",
+        "connections_num": "Connections opened since start",
+        "connections_lost": "Connections found broken by a health check since start",
+        "returns_bad": "Connections returned in a bad state since start",
+        "checks_run": "Checkouts that ran a health check since start",
+        "checks_skipped": "Checkouts that skipped the health check (recently used) since start",
+    }
+
+    def __init__(self):
+        self.pools = {}
+
+    def collect(self):
+        if not self.pools:
+            return
+        stats = {name: pool.get_stats() for name, pool in self.pools.items()}
+        for key, doc in self.GAUGES.items():
+            gauge = GaugeMetricFamily(f"cerina_pool_{key}", doc, labels=["pool"])
+            for name, pool_stats in stats.items():
+                gauge.add_metric([name], pool_stats.get(key, 0))
+            yield gauge
+
+
+_pool_collector = _PoolCollector()
+_pool_collector_lock = threading.Lock()
+_pool_collector_registered = False
+
+
+def register_pool(pool, name):
+    """Expose `pool` stats on /metrics as pool=`name` (called once the pool exists)."""
+    global _pool_collector_registered
+    with _pool_collector_lock:
+        _pool_collector.pools[name] = pool
+        if not _pool_collector_registered and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            REGISTRY.register(_pool_collector)
+            _pool_collector_registered = True
+
+
+def render():
+    """Return (body, content_type) for the /metrics response."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
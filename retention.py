@@ -0,0 +1,213 @@
+"""
+Session deletion and retention.
+
+delete_sessions() removes everything stored for a set of threads
+(checkpoints, side tables, session metadata) in a single transaction,
+so a failure leaves nothing half-deleted.
+
+The retention sweeper periodically deletes sessions that were never
+approved and have had no checkpoint for RETENTION_DAYS (or never got
+one), in bounded batches, so the checkpoint tables stop growing forever.
+
+    python retention.py --days 30 --dry-run
+"""
+
+import argparse
+import os
+import threading
+import time
+import traceback
+
+from checkpoint_store import get_pool
+
+# - RETENTION_DAYS: sweep unapproved sessions idle this long (0 disables the sweeper)
+# - RETENTION_KEEP_EXERCISES: keep saved_exercises rows of swept sessions
+# - RETENTION_SWEEP_INTERVAL: seconds between sweeps
+# - RETENTION_BATCH_SIZE / RETENTION_MAX_BATCHES: sessions per transaction / batches per sweep
+# - RETENTION_BATCH_PAUSE: seconds between batches, to leave room for live traffic
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_KEEP_EXERCISES = os.getenv("RETENTION_KEEP_EXERCISES", "true").lower() == "true"
+RETENTION_SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+RETENTION_MAX_BATCHES = int(os.getenv("RETENTION_MAX_BATCHES", "50"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.5"))
+
+# Every table keyed by thread_id. Side tables are created lazily, so only
+# the ones that exist are touched.
+SESSION_TABLES = (
+    'checkpoint_writes', 'checkpoint_blobs', 'checkpoints',
+    'session_history', 'stream_events', 'generation_jobs',
+    'saved_exercises', 'session_metadata',
+)
+
+# Only one process sweeps at a time
+_SWEEP_LOCK_KEY = 0x63657269  # "ceri"
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+_last_sweep = None
+
+
+def _existing_tables(cur):
+    cur.execute(
+        "SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname = ANY(%s) "
+        "AND relnamespace = current_schema()::regnamespace",
+        (list(SESSION_TABLES),)
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    return [table for table in SESSION_TABLES if table in existing]
+
+
+def delete_sessions(thread_ids, keep_exercises=False):
+    """
+    Delete all data for `thread_ids` in one transaction.
+    Returns {table: rows_deleted}. Raises (and deletes nothing) on error.
+    """
+    thread_ids = list(dict.fromkeys(thread_ids))
+    counts = {}
+    if not thread_ids:
+        return counts
+    with get_pool().connection() as conn:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                for table in _existing_tables(cur):
+                    if keep_exercises and table == 'saved_exercises':
+                        continue
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (thread_ids,))
+                    counts[table] = cur.rowcount
+    return counts
+
+
+def find_expired(days, limit):
+    """
+    Up to `limit` thread ids idle for `days` and never approved: threads
+    whose latest checkpoint (walked in primary-key order, so only that row's
+    JSON is read) is older than that with no final_output or saved
+    exercise, plus session_metadata rows that never got a checkpoint.
+    """
+    seconds = days * 86400
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH latest AS (
+                    SELECT DISTINCT ON (thread_id) thread_id, checkpoint
+                    FROM checkpoints
+                    WHERE checkpoint_ns = ''
+                    ORDER BY thread_id, checkpoint_id DESC
+                )
+                SELECT thread_id FROM latest
+                WHERE (checkpoint->>'ts')::timestamptz < now() - make_interval(secs => %s)
+                  AND coalesce(checkpoint->'channel_values'->>'final_output', '') = ''
+                  AND NOT EXISTS (SELECT 1 FROM saved_exercises s WHERE s.thread_id = latest.thread_id)
+                UNION ALL
+                SELECT m.thread_id FROM session_metadata m
+                WHERE m.created_at < LOCALTIMESTAMP - make_interval(secs => %s)
+                  AND NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = m.thread_id)
+                LIMIT %s
+            """, (seconds, seconds, limit))
+            return [row[0] for row in cur.fetchall()]
+
+
+def sweep(days=None, keep_exercises=None, batch_size=None, max_batches=None):
+    """
+    Delete expired sessions in batches of `batch_size` (one transaction
+    each). The expired set is computed once per sweep, capped at
+    batch_size x max_batches.
+    Returns {'sessions': n, 'rows': {table: n}, ...}, or None if
+    another process holds the sweep lock.
+    """
+    global _last_sweep
+    days = RETENTION_DAYS if days is None else days
+    keep_exercises = RETENTION_KEEP_EXERCISES if keep_exercises is None else keep_exercises
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    max_batches = max_batches or RETENTION_MAX_BATCHES
+
+    started = time.time()
+    report = {'sessions': 0, 'rows': {}, 'batches': 0}
+    with get_pool().connection() as lock_conn:
+        # Session-level lock: survives the commit, so the connection isn't
+        # left idle in a transaction while the batches run
+        with lock_conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_SWEEP_LOCK_KEY,))
+            locked = cur.fetchone()[0]
+        lock_conn.commit()
+        if not locked:
+            return None
+        try:
+            expired = find_expired(days, batch_size * max_batches)
+            for start in range(0, len(expired), batch_size):
+                if start:
+                    time.sleep(RETENTION_BATCH_PAUSE)
+                thread_ids = expired[start:start + batch_size]
+                for table, count in delete_sessions(thread_ids, keep_exercises).items():
+                    report['rows'][table] = report['rows'].get(table, 0) + count
+                report['sessions'] += len(thread_ids)
+                report['batches'] += 1
+        finally:
+            with lock_conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_SWEEP_LOCK_KEY,))
+            lock_conn.commit()
+
+    report['seconds'] = round(time.time() - started, 2)
+    report['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    _last_sweep = report
+    return report
+
+
+def _sweep_forever():
+    while True:
+        try:
+            report = sweep()
+            if report and report['sessions']:
+                print(f"Retention sweep removed {report['sessions']} sessions "
+                      f"({sum(report['rows'].values())} rows): {report['rows']}")
+        except Exception as e:
+            print(f"Retention sweep failed: {e}")
+            traceback.print_exc()
+        time.sleep(RETENTION_SWEEP_INTERVAL)
+
+
+def start_sweeper():
+    """Start the background sweeper once per process (no-op if RETENTION_DAYS is 0)."""
+    global _sweeper
+    if RETENTION_DAYS <= 0:
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name="cerina-retention", daemon=True)
+            _sweeper.start()
+
+
+def get_stats():
+    """Retention settings and the last sweep report for /health."""
+    return {
+        'retention_days': RETENTION_DAYS,
+        'keep_exercises': RETENTION_KEEP_EXERCISES,
+        'last_sweep': _last_sweep
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete unapproved Cerina sessions idle for N days.")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS or 30)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=RETENTION_MAX_BATCHES)
+    parser.add_argument("--delete-exercises", action="store_true",
+                        help="also delete saved_exercises rows of swept sessions")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many sessions would go")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        expired = find_expired(args.days, args.batch_size * args.max_batches)
+        print(f"{len(expired)} sessions idle for {args.days} days would be deleted")
+        return
+
+    report = sweep(args.days, False if args.delete_exercises else None, args.batch_size, args.max_batches)
+    if report is None:
+        print("Another sweep is running")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
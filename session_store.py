@@ -0,0 +1,54 @@
+"""
+Writes to the app's own session tables (session_metadata, saved_exercises),
+shared by the Flask routes, the batch runner and the job workers.
+"""
+
+from contextlib import nullcontext
+
+from checkpoint_store import get_pool
+from agent import semantic_cache
+
+
+def _connection(conn):
+    """`conn` as-is when the caller already holds one, else a pool checkout."""
+    return nullcontext(conn) if conn is not None else get_pool().connection()
+
+
+def save_session_metadata(thread_id, user_query, conn=None):
+    """
+    Record a session title for the sidebar; never raises.
+    Pass `conn` (e.g. checkpointer.conn) to reuse a connection the request holds.
+    """
+    try:
+        with _connection(conn) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO session_metadata (thread_id, title) VALUES (%s, %s) ON CONFLICT (thread_id) DO NOTHING",
+                    (thread_id, user_query[:100])
+                )
+    except Exception as e:
+        print(f"Failed to save session metadata: {e}")
+
+
+def save_exercise(thread_id, result, conn=None):
+    """
+    Persist an approved exercise from a final graph state and add it to the
+    semantic cache if it passed safety. Returns True if the row was written.
+    `conn` as in save_session_metadata.
+    """
+    safety_pass = result.get('metadata', {}).get('safety_pass', True)
+    saved = False
+    try:
+        with _connection(conn) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO saved_exercises (thread_id, query, content, safety_pass) VALUES (%s, %s, %s, %s)",
+                    (thread_id, result.get('user_query', ''), result.get('final_output'), safety_pass)
+                )
+        saved = True
+    except Exception as e:
+        print(f"Failed to save exercise: {e}")
+
+    if safety_pass:
+        semantic_cache.add(result.get('user_query', ''), result.get('final_output'))
+    return saved
@@ -0,0 +1,155 @@
+"""
+Speculative drafting (opt-in).
+
+While a session waits at human_approval, generate the draft a "reject"
+would produce (plus its safety and critic reviews) in the background and
+checkpoint it on the same thread as state.speculative. On reject,
+supervisor_agent serves it immediately if it passed both reviews and was
+made for the draft being rejected; on approve/edit it is discarded.
+"""
+
+import contextvars
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from state import draft_hash, keep_recent, MAX_PREVIOUS_DRAFTS
+from agent.drafter_agent import drafter_agent
+from agent.safety_agent import safety_agent
+from agent.critic_agent import critic_agent
+from agent.stream_utils import set_stream_callback
+
+# - SPECULATIVE_DRAFTING: enable background drafts for interactive sessions
+# - SPECULATIVE_TIMEOUT: wall-clock budget (seconds) per speculative draft + reviews
+# - SPECULATIVE_MAX_WORKERS: concurrent speculations; extra sessions are skipped
+# - SPECULATIVE_REJECT_WAIT: on reject, how long to wait for one still in progress
+SPECULATIVE_DRAFTING = os.getenv("SPECULATIVE_DRAFTING", "false").lower() == "true"
+SPECULATIVE_TIMEOUT = float(os.getenv("SPECULATIVE_TIMEOUT", "90"))
+SPECULATIVE_MAX_WORKERS = int(os.getenv("SPECULATIVE_MAX_WORKERS", "2"))
+SPECULATIVE_REJECT_WAIT = float(os.getenv("SPECULATIVE_REJECT_WAIT", "10"))
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_WORKERS, thread_name_prefix="cerina-speculative")
+_slots = threading.BoundedSemaphore(SPECULATIVE_MAX_WORKERS)
+
+# thread_id -> _Speculation in progress
+_active = {}
+_active_lock = threading.Lock()
+
+
+class SpeculationCancelled(Exception):
+    """Raised from the token callback to stop a speculative draft early."""
+
+
+class _Speculation:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.deadline = time.monotonic() + SPECULATIVE_TIMEOUT
+        # Held while writing the result so cancel() can't race the write
+        self.write_lock = threading.Lock()
+
+    def check(self, _token=None):
+        if self.cancelled.is_set():
+            raise SpeculationCancelled(f"Speculation for {self.thread_id} cancelled")
+        if time.monotonic() > self.deadline:
+            raise SpeculationCancelled(f"Speculation for {self.thread_id} over budget")
+
+
+def schedule(thread_id, state):
+    """
+    Start a speculative alternative to state.draft for thread_id, unless
+    disabled, already running for this thread, or at capacity.
+    """
+    if not SPECULATIVE_DRAFTING or not thread_id or not state.draft:
+        return
+    if state.speculative.get("base_hash") == draft_hash(state.draft):
+        return  # already have one for this draft
+    with _active_lock:
+        if thread_id in _active or not _slots.acquire(blocking=False):
+            return
+        spec = _Speculation(thread_id)
+        _active[thread_id] = spec
+    try:
+        _executor.submit(contextvars.Context().run, _speculate, spec, state.model_copy(deep=True))
+    except Exception:
+        _finish(spec)
+        raise
+
+
+def _finish(spec):
+    with _active_lock:
+        if _active.get(spec.thread_id) is spec:
+            del _active[spec.thread_id]
+    spec.done.set()
+    _slots.release()
+
+
+def _speculate(spec, state):
+    from graph_builder import get_graph
+
+    try:
+        base_hash = draft_hash(state.draft)
+
+        # Same inputs the drafter would see after supervisor handles "reject"
+        rejected = state.model_copy(update={
+            "draft": "",
+            "previous_drafts": keep_recent(state.previous_drafts + [state.draft], MAX_PREVIOUS_DRAFTS),
+            "metadata": {**state.metadata, "user_rejected": True,
+                         "rejections": state.metadata.get("rejections", 0) + 1},
+        })
+        # The drafter streams through the context callback; use it as a budget check
+        set_stream_callback(spec.check)
+        drafted = drafter_agent(rejected)
+        spec.check()
+        if drafted["metadata"].get("draft_aborted"):
+            return  # failed pipelined safety; nothing worth serving
+
+        candidate = rejected.model_copy(update={"draft": drafted["draft"]})
+        safety = safety_agent(candidate)
+        spec.check()
+        critic = critic_agent(candidate)
+
+        # Only keep drafts that would go straight to human approval
+        if not (safety["metadata"]["safety_pass"] and critic["metadata"]["critic_pass"]):
+            return
+
+        with spec.write_lock:
+            spec.check()
+            graph = get_graph()
+            config = {"configurable": {"thread_id": spec.thread_id}}
+            current = graph.get_state(config).values
+            if draft_hash(current.get("draft", "")) != base_hash or current.get("final_output"):
+                return  # session moved on
+            graph.update_state(config, {"speculative": {
+                "base_hash": base_hash,
+                "draft": drafted["draft"],
+                "iterations": drafted["metadata"]["iterations"],
+            }}, as_node="human_approval")
+    except SpeculationCancelled as e:
+        print(e)
+    except Exception as e:
+        print(f"Speculative draft failed for {spec.thread_id}: {e}")
+        traceback.print_exc()
+    finally:
+        _finish(spec)
+
+
+def cancel(thread_id, wait=0.0):
+    """
+    Stop speculation for thread_id before a user action is applied.
+    With `wait`, first give an in-progress speculation that long to finish
+    (used on reject, where its result is about to be served).
+    Returns once no further speculative write can happen.
+    """
+    with _active_lock:
+        spec = _active.get(thread_id)
+    if spec is None:
+        return
+    if wait > 0:
+        spec.done.wait(timeout=wait)
+    spec.cancelled.set()
+    with spec.write_lock:
+        pass
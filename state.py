@@ -1,20 +1,89 @@
-from typing import List, Dict, Any
+import hashlib
+import os
+from typing import List, Dict, Any, Annotated
 from pydantic import BaseModel, Field
 
+# History caps: only the most recent entries are kept in state, so the
+# checkpoint size and the drafter's context prompt stay bounded per loop.
+MAX_PREVIOUS_DRAFTS = int(os.getenv("MAX_PREVIOUS_DRAFTS", "3"))
+MAX_NOTES = int(os.getenv("MAX_NOTES", "3"))
+
+
+def keep_recent(items: List[str], limit: int) -> List[str]:
+    """Return the last `limit` items of a history list."""
+    return list(items)[-limit:] if limit > 0 else []
+
+
+def draft_hash(draft: str) -> str:
+    """Short content hash used to tie derived data to a specific draft."""
+    return hashlib.sha256((draft or "").encode("utf-8")).hexdigest()[:16]
+
+
+# Leading marker that makes a list update replace the channel (see reset_list)
+RESET_LIST = "__reset__"
+
+
+def reset_list(items: List[str] = ()) -> List[str]:
+    """Update for an append-only channel that replaces it with `items`."""
+    return [RESET_LIST, *items]
+
+
+def _append(current: List[Any], update: List[Any], limit: int = None) -> List[Any]:
+    update = list(update or [])
+    if update and update[0] == RESET_LIST:
+        items = update[1:]
+    else:
+        items = (current or []) + update
+    return items if limit is None else keep_recent(items, limit)
+
+
+def append_drafts(current: List[str], update: List[str]) -> List[str]:
+    """
+    Reducer for previous_drafts: nodes return only the new entries, which
+    are appended to the bounded window (reset_list() replaces it instead).
+    The full history is kept in the session_history side table (see
+    history_store.py), not in checkpoints.
+    """
+    return _append(current, update, MAX_PREVIOUS_DRAFTS)
+
+
+def append_notes(current: List[str], update: List[str]) -> List[str]:
+    """Reducer for safety_notes / critic_notes (same scheme as append_drafts)."""
+    return _append(current, update, MAX_NOTES)
+
+
+def append_pending(current: List[List[str]], update: List[List[str]]) -> List[List[str]]:
+    """
+    Reducer for pending_history: [kind, content] entries buffered during a
+    run and written to session_history in one insert when it ends (see
+    graph_builder.flush_history), which also resets the buffer.
+    """
+    return _append(current, update)
+
+
+def merge_metadata(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reducer for the metadata channel: shallow-merge updates instead of
+    replacing the dict, so parallel nodes (safety + critic) can each write
+    their own keys in the same step without overwriting each other.
+    """
+    return {**(current or {}), **(update or {})}
+
+
 class AgentState(BaseModel):
     # User input
     user_query: str = ""
 
     # Drafts
     draft: str = ""                    # current working draft
-    previous_drafts: List[str] = []    # older drafts
+    previous_drafts: Annotated[List[str], append_drafts] = []    # older drafts (last MAX_PREVIOUS_DRAFTS)
 
-    # Notes from agents
-    safety_notes: List[str] = []
-    critic_notes: List[str] = []
+    # Notes from agents (last MAX_NOTES each)
+    safety_notes: Annotated[List[str], append_notes] = []
+    critic_notes: Annotated[List[str], append_notes] = []
 
-    # Metadata
-    metadata: Dict[str, Any] = Field(default_factory=lambda: {
+    # Metadata (merged, not replaced — see merge_metadata)
+    metadata: Annotated[Dict[str, Any], merge_metadata] = Field(default_factory=lambda: {
         "iterations": 0,
         "safety_pass": True,
         "critic_pass": True,
@@ -22,6 +91,13 @@ class AgentState(BaseModel):
         "edited_by_user": False   # changed when user uses "Edit"
     })
 
+    # session_history entries not yet written (see append_pending). Not reset
+    # by initial_state: entries of a run that failed go out with the next one
+    pending_history: Annotated[List[List[str]], append_pending] = []
+
+    # Pre-generated alternative served on reject (see speculative.py)
+    speculative: Dict[str, Any] = {}
+
     # UI final output (user approved)
     final_output: str = ""
 
@@ -31,3 +107,28 @@ class AgentState(BaseModel):
 
     class Config:
         arbitrary_types_allowed = True
+
+
+def initial_state(user_query: str) -> Dict[str, Any]:
+    """
+    Fresh graph input for a new generation. metadata is merged, not
+    replaced, so every key a previous run on this thread may have set is
+    reset explicitly.
+    """
+    return {
+        "user_query": user_query,
+        "draft": "",
+        "previous_drafts": reset_list(),
+        "safety_notes": reset_list(),
+        "critic_notes": reset_list(),
+        "metadata": {
+            "iterations": 0, "safety_pass": True, "critic_pass": True,
+            "user_rejected": False, "edited_by_user": False,
+            "loop_start": 0, "best_draft": None, "rejections": 0,
+            "max_iterations_reached": False, "draft_aborted": False,
+            "next_node": "", "semantic_cache_hit": None,
+            "speculative_served": False, "safety_screen": []
+        },
+        "speculative": {},
+        "final_output": "", "user_action": "", "edited_text": ""
+    }
@@ -0,0 +1,598 @@
+"""
+Background graph runs for /stream.
+
+Runs execute on a shared, size-limited executor instead of a thread per
+request. Each run appends its events to a bounded ring buffer; SSE
+responses follow that buffer from an event id, so a client that drops can
+reattach with GET /stream/<thread_id> + Last-Event-ID and replay what it
+missed. A run with no attached client for STREAM_DETACH_GRACE seconds is
+cancelled, which also aborts the in-flight LLM stream via the token callback.
+
+The ASGI app (asgi.py) uses the same runs through start_async_run() and
+asse_frames(): the graph runs as an asyncio task via astream and SSE
+clients await new events instead of holding a thread each.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from checkpoint_store import get_pool
+from graph_builder import get_graph, aget_graph, run_config
+from agent.stream_utils import set_stream_callback, set_event_callback
+
+# - STREAM_MAX_WORKERS: concurrent graph runs for /stream (further requests get 503)
+# - STREAM_MAX_ASYNC_RUNS: the same limit for the ASGI app's asyncio runs
+# - STREAM_BUFFER_SIZE: events kept per run for replay; also how far a live
+#   client may lag before the producer blocks (backpressure)
+# - STREAM_PUT_TIMEOUT: seconds the producer waits for a lagging client
+# - STREAM_ASYNC_PUT_TIMEOUT: the same for async runs (default 0: never hold
+#   a node thread for a slow client; it replays from the spill or gets a gap)
+# - STREAM_IO_THREADS: threads doing the async runs' puts, spills and locking
+# - STREAM_HEARTBEAT_SECONDS: idle interval between SSE keep-alive comments
+# - STREAM_COALESCE_MS / STREAM_COALESCE_BYTES: tokens are batched into one
+#   event until this much time has passed or this many bytes are pending
+# - STREAM_DETACH_GRACE: seconds a run keeps going with no client attached
+# - STREAM_RETAIN_SECONDS: finished runs stay replayable this long
+# - STREAM_SPILL_POSTGRES: persist events evicted from the ring buffer so
+#   long runs can still be replayed from the start
+STREAM_MAX_WORKERS = int(os.getenv("STREAM_MAX_WORKERS", "8"))
+STREAM_MAX_ASYNC_RUNS = int(os.getenv("STREAM_MAX_ASYNC_RUNS", "1000"))
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "1000"))
+STREAM_PUT_TIMEOUT = float(os.getenv("STREAM_PUT_TIMEOUT", "30"))
+STREAM_ASYNC_PUT_TIMEOUT = float(os.getenv("STREAM_ASYNC_PUT_TIMEOUT", "0"))
+STREAM_IO_THREADS = int(os.getenv("STREAM_IO_THREADS", "4"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "50"))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "512"))
+STREAM_DETACH_GRACE = float(os.getenv("STREAM_DETACH_GRACE", "60"))
+STREAM_RETAIN_SECONDS = float(os.getenv("STREAM_RETAIN_SECONDS", "300"))
+STREAM_SPILL_POSTGRES = os.getenv("STREAM_SPILL_POSTGRES", "false").lower() == "true"
+
+_SPILL_BATCH = 50
+
+_executor = ThreadPoolExecutor(max_workers=STREAM_MAX_WORKERS, thread_name_prefix="cerina-stream")
+_slots = threading.BoundedSemaphore(STREAM_MAX_WORKERS)
+
+# Blocking work of async runs and SSE clients, kept off the event loop and
+# off the loop's default executor (which runs the graph nodes)
+_io_executor = ThreadPoolExecutor(max_workers=STREAM_IO_THREADS, thread_name_prefix="cerina-stream-io")
+
+# thread_id -> latest StreamRun (live or recently finished)
+_runs = {}
+_runs_lock = threading.Lock()
+_run_ids = itertools.count(int(time.time()))
+_async_runs = 0
+_table_ready = False
+
+
+class StreamCancelled(Exception):
+    """Raised inside a run once its client is gone; unwinds the graph and LLM stream."""
+
+
+def _ensure_table(conn):
+    global _table_ready
+    if _table_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stream_events (
+                thread_id TEXT NOT NULL,
+                run_id BIGINT NOT NULL,
+                seq BIGINT NOT NULL,
+                payload JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (thread_id, run_id, seq)
+            );
+        """)
+    _table_ready = True
+
+
+class StreamRun:
+    def __init__(self, thread_id, graph_input, release=None, put_timeout=STREAM_PUT_TIMEOUT):
+        self.thread_id = thread_id
+        self.run_id = next(_run_ids)
+        self.graph_input = graph_input
+        self.cancelled = threading.Event()
+        self.finished_at = None
+        self.put_timeout = put_timeout
+        self._release = release or _slots.release
+        self._task = None        # asyncio task of an async run
+        # Guards the ring buffer, event ids, subscribers and token buffer
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._buffer = deque()
+        self._next_seq = 1
+        self._subscribers = {}   # subscriber id -> last delivered seq
+        self._sub_ids = itertools.count(1)
+        # (loop, asyncio.Event) of async subscribers; own lock, never held for I/O
+        self._waiters = set()
+        self._waiters_lock = threading.Lock()
+        self._detached_at = time.monotonic()
+        self._spill = []
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_flush = time.monotonic()
+        self._streamed = []      # text streamed since the last node_complete
+        self._metadata = {}      # metadata as last sent to the client
+
+    def cancel(self):
+        self.cancelled.set()
+        with self._cond:
+            self._notify_locked()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    @property
+    def has_pending_tokens(self):
+        return bool(self._pending)
+
+    def _notify_locked(self):
+        self._cond.notify_all()
+        with self._waiters_lock:
+            waiters = list(self._waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    # ----------------------
+    # Producer side
+    # ----------------------
+    def put(self, event):
+        """
+        Append an event (tagged with the next event id). Pending tokens are
+        flushed first so events always arrive in the order they were produced.
+        """
+        with self._lock:
+            if event.get('type') != 'token':
+                self._flush_locked()
+            self._append_locked(event)
+
+    def _check_attached_locked(self):
+        if self.cancelled.is_set():
+            raise StreamCancelled(f"Stream for thread {self.thread_id} cancelled")
+        if not self._subscribers and time.monotonic() - self._detached_at > STREAM_DETACH_GRACE:
+            self.cancel()
+            raise StreamCancelled(f"No client attached to thread {self.thread_id} for {STREAM_DETACH_GRACE:.0f}s")
+
+    def _append_locked(self, event):
+        self._check_attached_locked()
+
+        # Backpressure: wait (bounded) while the slowest live client lags a
+        # full buffer behind; after that it has to replay from the spill
+        deadline = time.monotonic() + self.put_timeout
+        while (self._subscribers
+               and self._next_seq - min(self._subscribers.values()) > STREAM_BUFFER_SIZE
+               and time.monotonic() < deadline):
+            self._cond.wait(timeout=0.5)
+            self._check_attached_locked()
+
+        event = {'id': self._next_seq, **event}
+        self._next_seq += 1
+        self._buffer.append(event)
+        if len(self._buffer) > STREAM_BUFFER_SIZE:
+            evicted = self._buffer.popleft()
+            if STREAM_SPILL_POSTGRES:
+                self._spill.append(evicted)
+                if len(self._spill) >= _SPILL_BATCH:
+                    self._flush_spill_locked()
+        self._notify_locked()
+
+    def _flush_spill_locked(self):
+        if not self._spill:
+            return
+        rows = [(self.thread_id, self.run_id, e['id'], json.dumps(e)) for e in self._spill]
+        self._spill = []
+        try:
+            with get_pool().connection() as conn:
+                _ensure_table(conn)
+                with conn.cursor() as cur:
+                    cur.executemany(
+                        "INSERT INTO stream_events (thread_id, run_id, seq, payload) VALUES (%s, %s, %s, %s) "
+                        "ON CONFLICT DO NOTHING",
+                        rows
+                    )
+        except Exception as e:
+            print(f"Failed to spill stream events: {e}")
+
+    def _flush_locked(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+            self._append_locked({'type': 'token', 'token': text})
+        self._last_flush = time.monotonic()
+
+    def flush_tokens(self):
+        """Flush coalesced tokens whose window expired (called by the SSE side)."""
+        if not self._lock.acquire(blocking=False):
+            return  # producer is mid-put and flushes on its own
+        try:
+            if self._pending and (time.monotonic() - self._last_flush) * 1000 >= STREAM_COALESCE_MS:
+                self._flush_locked()
+        except StreamCancelled:
+            pass
+        finally:
+            self._lock.release()
+
+    def _token(self, token):
+        with self._lock:
+            self._check_attached_locked()
+            self._pending.append(token)
+            self._pending_bytes += len(token.encode('utf-8'))
+            self._streamed.append(token)
+            if (self._pending_bytes >= STREAM_COALESCE_BYTES
+                    or (time.monotonic() - self._last_flush) * 1000 >= STREAM_COALESCE_MS):
+                self._flush_locked()
+
+    def _compact(self, event):
+        """
+        Delta-only node_complete payload: omit text the client already has
+        (the streamed draft, drafts moved to previous_drafts, buffered
+        history entries) and send only
+        metadata keys that changed since the last event.
+        """
+        streamed = "".join(self._streamed)
+        self._streamed = []
+        compact = {}
+        for node, update in event.items():
+            if not isinstance(update, dict):
+                compact[node] = update
+                continue
+            update = dict(update)
+            update.pop('previous_drafts', None)
+            update.pop('pending_history', None)
+            if 'draft' in update and update['draft'] and update['draft'] == streamed:
+                del update['draft']
+                update['draft_streamed'] = True
+            if isinstance(update.get('metadata'), dict):
+                metadata = {
+                    key: value for key, value in update['metadata'].items()
+                    if self._metadata.get(key, object()) != value
+                }
+                self._metadata.update(metadata)
+                if isinstance(metadata.get('best_draft'), dict):
+                    metadata['best_draft'] = {k: v for k, v in metadata['best_draft'].items() if k != 'draft'}
+                update['metadata'] = metadata
+            compact[node] = update
+        return compact
+
+    def _put_node(self, event):
+        with self._lock:
+            self.put({
+                'type': 'node_complete',
+                'data': self._compact(event),
+                'timestamp': datetime.now().isoformat()
+            })
+
+    def _put_error(self, error):
+        print(f"Stream thread error: {error}")
+        traceback.print_exc()
+        try:
+            self.put({'type': 'error', 'error': str(error)})
+        except StreamCancelled:
+            pass
+
+    def _finish(self):
+        with self._cond:
+            self._flush_spill_locked()
+            self.finished_at = time.monotonic()
+            self._notify_locked()
+        self._release()
+
+    def _config(self):
+        # Interactive session: pre-draft an alternative while the user reviews
+        return run_config(self.thread_id, speculate=True)
+
+    def run(self):
+        set_stream_callback(self._token)
+        set_event_callback(self.put)
+        try:
+            print(f"Starting stream for thread {self.thread_id}")
+            for event in get_graph().stream(self.graph_input, config=self._config()):
+                self._put_node(event)
+            self.put({'type': 'complete'})
+        except StreamCancelled as e:
+            print(e)
+        except Exception as e:
+            self._put_error(e)
+        finally:
+            self._finish()
+
+    async def arun(self):
+        """
+        run() for the event loop. Tokens and emitted events arrive on the
+        node threads; node_complete events are put from the stream I/O
+        executor since put() takes the run lock and may spill to Postgres.
+        """
+        set_stream_callback(self._token)
+        set_event_callback(self.put)
+        try:
+            print(f"Starting async stream for thread {self.thread_id}")
+            graph = await aget_graph()
+            async for event in graph.astream(self.graph_input, config=self._config()):
+                await _in_io_thread(self._put_node, event)
+            await _in_io_thread(self.put, {'type': 'complete'})
+        except StreamCancelled as e:
+            print(e)
+        except Exception as e:
+            await _in_io_thread(self._put_error, e)
+        finally:
+            await _in_io_thread(self._finish)
+
+    # ----------------------
+    # Subscriber side
+    # ----------------------
+    def subscribe(self, after_seq):
+        with self._lock:
+            sub_id = next(self._sub_ids)
+            self._subscribers[sub_id] = after_seq
+            return sub_id
+
+    def unsubscribe(self, sub_id):
+        with self._cond:
+            self._subscribers.pop(sub_id, None)
+            if not self._subscribers:
+                self._detached_at = time.monotonic()
+            self._cond.notify_all()
+
+    def add_waiter(self, waiter):
+        """Register (loop, asyncio.Event), set whenever the run has news."""
+        with self._waiters_lock:
+            self._waiters.add(waiter)
+
+    def remove_waiter(self, waiter):
+        with self._waiters_lock:
+            self._waiters.discard(waiter)
+
+    def poll_events(self, sub_id, after_seq):
+        """
+        wait_events(timeout=0) that never blocks on the run lock: returns
+        None while a producer holds it (e.g. spilling to Postgres).
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self.wait_events(sub_id, after_seq, timeout=0)
+        finally:
+            self._lock.release()
+
+    def wait_events(self, sub_id, after_seq, timeout):
+        """
+        Return (events, gap_from) with every buffered event after `after_seq`,
+        waiting up to `timeout` if there are none (timeout=0 never blocks).
+        gap_from is the first missing seq when older events were evicted
+        from the ring, else None.
+        """
+        with self._cond:
+            if not self._buffer or self._buffer[-1]['id'] <= after_seq:
+                if self.finished or self.cancelled.is_set() or not timeout:
+                    return [], None
+                self._cond.wait(timeout=timeout)
+            events = [e for e in self._buffer if e['id'] > after_seq]
+            gap_from = None
+            if events and events[0]['id'] > after_seq + 1:
+                gap_from = after_seq + 1
+            if events:
+                self._subscribers[sub_id] = events[-1]['id']
+                self._cond.notify_all()
+            return events, gap_from
+
+    def spilled_events(self, after_seq, before_seq):
+        """Events evicted from the ring (Postgres spill), oldest first."""
+        if not STREAM_SPILL_POSTGRES:
+            return []
+        with self._lock:
+            self._flush_spill_locked()
+        try:
+            with get_pool().connection() as conn:
+                _ensure_table(conn)
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT payload FROM stream_events "
+                        "WHERE thread_id = %s AND run_id = %s AND seq > %s AND seq < %s ORDER BY seq",
+                        (self.thread_id, self.run_id, after_seq, before_seq)
+                    )
+                    return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Failed to read spilled stream events: {e}")
+            return []
+
+
+def _prune_runs_locked():
+    now = time.monotonic()
+    for thread_id, run in list(_runs.items()):
+        if run.finished and now - run.finished_at > STREAM_RETAIN_SECONDS:
+            del _runs[thread_id]
+
+
+def _register(run):
+    """Make `run` the thread's current run, cancelling a live predecessor."""
+    with _runs_lock:
+        _prune_runs_locked()
+        previous = _runs.get(run.thread_id)
+        if previous is not None and not previous.finished:
+            previous.cancel()
+        _runs[run.thread_id] = run
+
+
+def start_run(thread_id, graph_input):
+    """Start a graph run on the shared executor; returns None when at capacity."""
+    if not _slots.acquire(blocking=False):
+        return None
+    run = StreamRun(thread_id, graph_input)
+    try:
+        _register(run)
+        # Fresh context per run so stream callbacks never leak between
+        # runs that reuse the same worker thread
+        _executor.submit(contextvars.Context().run, run.run)
+    except Exception:
+        _slots.release()
+        raise
+    return run
+
+
+def _release_async_slot():
+    global _async_runs
+    with _runs_lock:
+        _async_runs -= 1
+
+
+def start_async_run(thread_id, graph_input):
+    """
+    Start a graph run as a task on the running event loop (ASGI app);
+    returns None when STREAM_MAX_ASYNC_RUNS are already live.
+    """
+    global _async_runs
+    with _runs_lock:
+        if _async_runs >= STREAM_MAX_ASYNC_RUNS:
+            return None
+        _async_runs += 1
+    run = StreamRun(thread_id, graph_input, release=_release_async_slot, put_timeout=STREAM_ASYNC_PUT_TIMEOUT)
+    try:
+        _register(run)
+        # Fresh context per run, as in start_run (the task copies it)
+        loop = asyncio.get_running_loop()
+        run._task = contextvars.Context().run(loop.create_task, run.arun())
+    except Exception:
+        _release_async_slot()
+        raise
+    return run
+
+
+def get_run(thread_id):
+    """Latest live or recently finished run for a thread, or None."""
+    with _runs_lock:
+        _prune_runs_locked()
+        return _runs.get(thread_id)
+
+
+def parse_event_id(run, last_event_id):
+    """
+    Map a Last-Event-ID ("<run_id>-<seq>") to a seq within `run`.
+    Ids from another (older) run replay the current run from the start.
+    """
+    try:
+        run_id, seq = str(last_event_id).rsplit('-', 1)
+        return int(seq) if int(run_id) == run.run_id else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def sse_frames(run, after_seq=0):
+    """
+    Follow a run's events as SSE frames (with `id:` fields and compact JSON)
+    starting after `after_seq`: replays buffered (and spilled) events, then
+    live output, flushing coalesced tokens and sending keep-alive comments
+    while idle. Closing the generator detaches this client from the run.
+    """
+    poll = min(STREAM_COALESCE_MS / 1000, STREAM_HEARTBEAT_SECONDS)
+    last_sent = time.monotonic()
+    sub_id = run.subscribe(after_seq)
+    try:
+        while True:
+            events, gap_from = run.wait_events(sub_id, after_seq, timeout=poll)
+            if not events:
+                if run.finished or run.cancelled.is_set():
+                    break
+                run.flush_tokens()
+                if time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ": heartbeat\n\n"
+                continue
+
+            if gap_from is not None:
+                spilled = run.spilled_events(after_seq, events[0]['id'])
+                if not spilled or spilled[0]['id'] != gap_from:
+                    # Missed events are gone: client should reload state (/history)
+                    yield format_sse(run, {'id': gap_from, 'type': 'gap'})
+                events = spilled + events
+
+            last_sent = time.monotonic()
+            for event in events:
+                after_seq = event['id']
+                yield format_sse(run, event)
+                if event['type'] in ('complete', 'error'):
+                    return
+    finally:
+        run.unsubscribe(sub_id)
+
+
+async def _in_io_thread(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, functools.partial(fn, *args))
+
+
+async def asse_frames(run, after_seq=0):
+    """
+    sse_frames() for the event loop: same frames, but waits on an
+    asyncio.Event the run sets on new events instead of blocking a thread.
+    The loop never blocks on the run lock: polls give up while it is held,
+    and anything else that takes it runs on the stream I/O executor.
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    waiter = (loop, wakeup)
+    last_sent = time.monotonic()
+    sub_id = await _in_io_thread(run.subscribe, after_seq)
+    run.add_waiter(waiter)
+    try:
+        while True:
+            wakeup.clear()
+            polled = run.poll_events(sub_id, after_seq)
+            if polled is None:
+                # Run lock busy: its holder sets wakeup when done; retry soon regardless
+                try:
+                    await asyncio.wait_for(wakeup.wait(), STREAM_COALESCE_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            events, gap_from = polled
+            if not events:
+                if run.finished or run.cancelled.is_set():
+                    break
+                if run.has_pending_tokens:
+                    await _in_io_thread(run.flush_tokens)
+                idle = time.monotonic() - last_sent
+                if idle >= STREAM_HEARTBEAT_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ": heartbeat\n\n"
+                    idle = 0
+                # Wake for the coalescing window only while tokens are pending
+                timeout = STREAM_COALESCE_MS / 1000 if run.has_pending_tokens else STREAM_HEARTBEAT_SECONDS - idle
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if gap_from is not None:
+                spilled = await _in_io_thread(run.spilled_events, after_seq, events[0]['id'])
+                if not spilled or spilled[0]['id'] != gap_from:
+                    yield format_sse(run, {'id': gap_from, 'type': 'gap'})
+                events = spilled + events
+
+            last_sent = time.monotonic()
+            for event in events:
+                after_seq = event['id']
+                yield format_sse(run, event)
+                if event['type'] in ('complete', 'error'):
+                    return
+    finally:
+        run.remove_waiter(waiter)
+        # Not awaited: the generator may be closing because the client left
+        _io_executor.submit(run.unsubscribe, sub_id)
+
+
+def format_sse(run, event):
+    payload = json.dumps({k: v for k, v in event.items() if k != 'id'}, separators=(',', ':'))
+    return f"id: {run.run_id}-{event['id']}\ndata: {payload}\n\n"